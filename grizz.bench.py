@@ -0,0 +1,176 @@
+#!/usr/bin/python
+
+"""benchmarks the grizz renderer on generated sites.
+
+each run appends one json line to the results file, with the site parameters, the git commit and the timings,
+so that runs can be compared across commits. e.g.:
+
+    python grizz.bench.py --pages 2000 --depth 4 --size 4000 --links 20
+"""
+
+import argparse
+import collections
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import grizz
+
+WORDS = '''lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore magna
+aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo consequat'''.split()
+
+def paragraph(rng, size, links, pages, markdown):
+    """returns about size bytes of text, as lines, with links {@name} tags to random pages"""
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        if markdown and rng.random() < 0.05:
+            word = '_%s_' % word
+        words.append(word)
+        length += len(word) + 1
+    for _ in range(links):
+        target = 'page%d' % rng.randrange(pages)
+        link = '[%s]({@%s})' % (target, target) if markdown else '<a href="{@%s}">%s</a>' % (target, target)
+        words.insert(rng.randrange(len(words) + 1), link)
+    lines = []
+    for start in range(0, len(words), 12):
+        lines.append(' '.join(words[start:start + 12]) + '\n')
+    return lines
+
+def generate_site(root_path, pages, depth, size, links, markdown, seed=0):
+    """writes a site of pages pages to root_path. each page's template includes depth levels of nested templates, and its content file has about size bytes of text
+    with links {@name} links to other pages. a fraction markdown of the content files are .markdown.
+
+    returns the path of the manifest.
+    """
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(root_path, 'templates'))
+    os.makedirs(os.path.join(root_path, 'pages'))
+    def write(path, lines):
+        with open(os.path.join(root_path, path), 'w') as f:
+            f.writelines(lines)
+
+    nav = '        <nav><a href="{@page0}">home</a> <a href="{@page%d}">last</a></nav>\n' % (pages - 1)
+    write('templates/page.html', ['<html>\n', '    <head>\n', '        <title>{title}</title>\n', '    </head>\n', '    <body>\n',
+                                  nav, '        {/templates/level1.inc}\n' if depth else '        {body}\n', '    </body>\n', '</html>\n'])
+    for level in range(1, depth + 1):
+        inner = '{/templates/level%d.inc}' % (level + 1) if level < depth else '{body}'
+        write('templates/level%d.inc' % level, ['<div class="level%d">\n' % level, '    <h%d>{title}</h%d>\n' % (min(level, 6), min(level, 6)),
+                                                '    %s\n' % inner, '</div>\n'])
+
+    manifest = []
+    for i in range(pages):
+        content = 'pages/page%d.%s' % (i, 'markdown' if rng.random() < markdown else 'txt')
+        write(content, ['title: Page %d\n' % i, '\n'] + paragraph(rng, size, links, pages, content.endswith('.markdown')))
+        path = 'index.html' if i == 0 else 'section%d/page%d.html' % (i // 100, i)
+        manifest.append('%s: (page%d)\n    templates/page.html\n    body: %s\n\n' % (path, i, content))
+    write('manifest', manifest)
+    return os.path.join(root_path, 'manifest')
+
+def best_of(repeat, setup, fn):
+    """calls setup and then times fn, repeat times, returning the fastest and median times in seconds"""
+    times = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {'best': times[0], 'median': times[len(times) // 2]}
+
+def quietly(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+def git_commit():
+    """returns the current commit of the working tree, marked if it has uncommitted changes, or None"""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+def run(args, root_path):
+    manifest_path = generate_site(root_path, args.pages, args.depth, args.size, args.links, args.markdown, args.seed)
+    out_path = os.path.join(root_path, 'out')
+    state_path = os.path.join(root_path, grizz.STATE_DIR)
+    with open(manifest_path) as f:
+        manifest = f.readlines()
+    files = grizz.manifest_to_files(manifest)
+    urls = grizz.url_index(files)
+    provider = grizz.CachingFileProvider(root_path)
+
+    def cold():
+        # nothing left from an earlier run
+        for path in [out_path, state_path]:
+            if os.access(path, os.F_OK):
+                shutil.rmtree(path)
+        grizz.markdown_cache = grizz.MarkdownCache()
+    def nothing():
+        pass
+    def touch_one():
+        with open(os.path.join(root_path, files[len(files) // 2]['content']['body']), 'a') as f:
+            f.write('more\n')
+    def render_all():
+        templates = {}
+        for f in files:
+            grizz.render_file(f, files, provider, lambda s: None, templates, urls)
+
+    results = collections.OrderedDict([
+        ('manifest_to_files', best_of(args.repeat, nothing, lambda: grizz.manifest_to_files(manifest))),
+        ('render_file', best_of(args.repeat, cold, render_all)),
+        ('render_from_manifest', best_of(args.repeat, cold,
+                                         lambda: quietly(grizz.render_from_manifest, manifest_path, cache=False, jobs=args.jobs))),
+        ('render_from_manifest_noop', best_of(args.repeat, nothing,
+                                              lambda: quietly(grizz.render_from_manifest, manifest_path, jobs=args.jobs))),
+        ('render_from_manifest_one_changed', best_of(args.repeat, touch_one,
+                                                     lambda: quietly(grizz.render_from_manifest, manifest_path, jobs=args.jobs))),
+    ])
+    stats = grizz.BuildStats()
+    cold()
+    quietly(grizz.render_from_manifest, manifest_path, cache=False, jobs=args.jobs, stats=stats)
+    return results, stats.phases()
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmarks the grizz renderer on a generated site')
+    parser.add_argument('--pages', type=int, default=500, help='number of pages (default: 500)')
+    parser.add_argument('--depth', type=int, default=3, help='levels of nested template includes (default: 3)')
+    parser.add_argument('--size', type=int, default=2000, help='bytes of content per page (default: 2000)')
+    parser.add_argument('--links', type=int, default=10, help='{@name} links per page (default: 10)')
+    parser.add_argument('--markdown', type=float, default=0.25, help='fraction of pages with markdown content (default: 0.25)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the generated site (default: 0)')
+    parser.add_argument('--repeat', type=int, default=5, help='times to run each benchmark (default: 5)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='worker processes for render_from_manifest (default: 1)')
+    parser.add_argument('--results', default='bench-results.jsonl', help='file to append results to (default: bench-results.jsonl)')
+    parser.add_argument('--keep', action='store_true', help='keep the generated site, and print where it is')
+    args = parser.parse_args()
+
+    root_path = tempfile.mkdtemp(prefix='grizz-bench-')
+    try:
+        results, phases = run(args, root_path)
+    finally:
+        if args.keep:
+            print('site kept at %s' % root_path)
+        else:
+            shutil.rmtree(root_path)
+
+    params = dict((name, getattr(args, name)) for name in ['pages', 'depth', 'size', 'links', 'markdown', 'seed', 'repeat', 'jobs'])
+    for name, result in results.items():
+        print('%-34s best %8.4fs  median %8.4fs' % (name, result['best'], result['median']))
+    print('phases: ' + ', '.join('%s %.3fs' % (phase, phases[phase]) for phase in grizz.BuildStats.PHASES))
+    record = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': git_commit(), 'python': sys.version.split()[0],
+              'params': params, 'results': results, 'phases': phases}
+    with open(args.results, 'a') as f:
+        f.write(json.dumps(record, sort_keys=True) + '\n')
+    print('results appended to %s' % args.results)
+
+if __name__ == '__main__':
+    main()
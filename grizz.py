@@ -8,23 +8,97 @@
 
 import os
 import re
+import json
+import hashlib
+import collections
+import shutil
+import pickle
+import fnmatch
+import threading
 import markdown
 import sys
 import time
+import functools
+import email.utils
+import io
+import posixpath
+import urllib.parse
+import gzip
+import mimetypes
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 import traceback
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 path_re = r'(?P<path>[-a-zA-Z0-9_./]+)'
 name_re = r'(?P<name>[\w-]+)'
 info_re = r'^(?P<name>[^:]+):\s*(?P<contents>.+)\n$'
 
+manifest_path_pattern = re.compile(path_re + r':(\s+\(' + name_re + r'\))?')
+manifest_template_pattern = re.compile(path_re)
+manifest_content_pattern = re.compile(name_re + ': ' + path_re)
+text_tag_pattern = re.compile(r'{' + name_re + '}')
+include_tag_pattern = re.compile(r'{/' + path_re + '}')
+url_tag_pattern = re.compile(r'{\@' + name_re + '}')
+
+# segment types of a compiled template
+LITERAL = 'literal'
+TEXT = 'text'
+
 NOW_TIME = int(time.time())
 
+STATE_DIR = '.grizz'
+DEPS_FILE = 'deps.json'
+STATS_FILE = 'stats.json'
+CACHE_DIR = 'cache'
+MANIFEST_CACHE_FILE = 'manifest.pickle'
+ASSETS_FILE = 'assets.json'
+CACHE_VERSION = 2
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+MARKDOWN_EXTENSIONS = []
+
+# files written by editors and other tools, which never affect the site
+IGNORED_FILE_PATTERNS = ['*.swp', '*.swx', '*.swo', '*~', '.#*', '#*#', '4913', '.DS_Store', '*.tmp']
+
+# precompressed siblings of output files, e.g. out/index.html.gz, in order of preference when serving
+COMPRESSED_SUFFIXES = collections.OrderedDict([('zstd', '.zst'), ('gzip', '.gz')])
+COMPRESSION_ENCODINGS = [encoding for encoding in COMPRESSED_SUFFIXES if encoding != 'zstd' or zstandard]
+COMPRESSIBLE_TYPES = ['application/javascript', 'application/json', 'application/xml', 'image/svg+xml']
+
+# live reload: the preview server streams the paths of changed output files from RELOAD_EVENTS_PATH to RELOAD_SCRIPT in each html page,
+# which reloads the page if it changed, or if any file that isn't a page (e.g. a stylesheet) did
+RELOAD_EVENTS_PATH = '/_grizz/events'
+RELOAD_KEEPALIVE = 15
+RELOAD_SCRIPT = b"""<script>
+(function() {
+    var path = decodeURIComponent(location.pathname).replace(/^\\//, '');
+    if (path === '' || path.slice(-1) === '/') path += 'index.html';
+    new EventSource('%s').onmessage = function(e) {
+        var paths = JSON.parse(e.data);
+        for (var i = 0; i < paths.length; i++) {
+            if (paths[i] === path || !/\\.html?$/.test(paths[i])) {
+                location.reload();
+                return;
+            }
+        }
+    };
+})();
+</script>
+""" % RELOAD_EVENTS_PATH.encode('ascii')
+
 class InvalidLineError(Exception):
-    def __init__(self, expected, line):
+    def __init__(self, expected, line, lineno=None):
         self.expected = expected
         self.line = line
+        self.lineno = lineno
     def __str__(self):
-        return 'Invalid line: expecting %s, got "%s"' % (self.expected, self.line)
+        if self.lineno is None:
+            return 'Invalid line: expecting %s, got "%s"' % (self.expected, self.line)
+        return 'Invalid line %d: expecting %s, got "%s"' % (self.lineno, self.expected, self.line)
 
 class NoSuchFileError(Exception):
     def __init__(self, path):
@@ -32,66 +106,226 @@ class NoSuchFileError(Exception):
     def __str__(self):
         return self.path
 
-def manifest_to_files(manifest):
-    """converts a manifest into a list of file objects, one per file in the manifest.
+class TemplateCycleError(Exception):
+    def __init__(self, chain):
+        self.chain = chain
+    def __str__(self):
+        return ' -> '.join(self.chain)
+
+class Page(object):
+    """a page of a manifest: its output path, optional name, template, dict of named content files (or None), and the manifest line it starts on.
+
+    a page can be read like the dicts returned by manifest_to_files, e.g. page['template'] or 'name' in page.
+    """
+    __slots__ = ('path', 'name', 'template', 'content', 'line')
+    fields = ('path', 'name', 'template', 'content')
+
+    def __init__(self, path, name=None, template=None, content=None, line=None):
+        self.path = path
+        self.name = name
+        self.template = template
+        self.content = content
+        self.line = line
+
+    def __getitem__(self, key):
+        value = getattr(self, key) if key in self.fields else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return key in self.fields and getattr(self, key) is not None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def as_dict(self):
+        """returns the page as a dict, as returned by manifest_to_files"""
+        return dict((key, getattr(self, key)) for key in self.fields if getattr(self, key) is not None)
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+def parse_manifest(manifest):
+    """parses a manifest into a list of Page records, one per file in the manifest, in a single pass.
 
     manifest should be an iterable of lines (e.g. a file handle, list of strings, etc.)
     """
     ret = []
-    file = {}
-    for line in manifest:
+    page = None
+    for lineno, line in enumerate(manifest, 1):
         line = line.strip()
-        if (not line) and file:
-            ret.append(file)
-            file = {}
-        elif not 'path' in file:
-            m = re.match(path_re + ':(\s+\(' + name_re + '\))?', line)
-            if not m: raise InvalidLineError('path', line)
-            file['path'] = m.group('path').lstrip('/')
-            if m.group('name'):
-                file['name'] = m.group('name')
-        elif not 'template' in file:
-            m = re.match(path_re, line)
-            if not m: raise InvalidLineError('template', line)
-            file['template'] = m.group('path').lstrip('/')
+        if (not line) and page:
+            ret.append(page)
+            page = None
+        elif page is None:
+            m = manifest_path_pattern.match(line)
+            if not m: raise InvalidLineError('path', line, lineno)
+            page = Page(m.group('path').lstrip('/'), m.group('name') or None, line=lineno)
+        elif page.template is None:
+            m = manifest_template_pattern.match(line)
+            if not m: raise InvalidLineError('template', line, lineno)
+            page.template = m.group('path').lstrip('/')
         else:
-            if not 'content' in file:
-                file['content'] = {}
-            m = re.match(r'' + name_re + ': ' + path_re, line)
-            if not m: raise InvalidLineError('content', line)
-            if m.group('name') in file['content']:
-                raise Exception('found extra definition of %s content in %s' % (m.group('name'), file['path']))
-            file['content'][m.group('name')] = m.group('path').lstrip('/')
-    if file:
-        ret.append(file)
+            if page.content is None:
+                page.content = {}
+            m = manifest_content_pattern.match(line)
+            if not m: raise InvalidLineError('content', line, lineno)
+            if m.group('name') in page.content:
+                raise Exception('found extra definition of %s content in %s on line %d' % (m.group('name'), page.path, lineno))
+            page.content[m.group('name')] = m.group('path').lstrip('/')
+    if page:
+        ret.append(page)
     return ret
 
-def render_file(file, files, file_provider, error_handler):
-    """renders file into a list of strings, based on the given files"""
-    ret = []
-    lines = file_provider(file['template'])
-    try:
-        lines = replace_template_tags(lines, file_provider)
-    except NoSuchFileError as e: # included file not found
-        error_handler('''error: referenced template %s in %s not found''' % (e, file['template']))
-    
+def manifest_to_files(manifest):
+    """converts a manifest into a list of file objects, one per file in the manifest.
+
+    manifest should be an iterable of lines (e.g. a file handle, list of strings, etc.)
+    """
+    return [page.as_dict() for page in parse_manifest(manifest)]
+
+def load_manifest(manifest_path, state_path=None):
+    """returns the Page records of the manifest at manifest_path.
+
+    if state_path is given, the records are cached there, and reused for as long as the manifest is unchanged.
+    """
+    signature = [CACHE_VERSION, file_signature(manifest_path)]
+    if state_path:
+        try:
+            with open(os.path.join(state_path, MANIFEST_CACHE_FILE), 'rb') as f:
+                cached_signature, pages = pickle.load(f)
+            if cached_signature == signature:
+                return pages
+        except Exception: # no cache, or one we can't read
+            pass
+    with open(manifest_path) as manifest:
+        pages = parse_manifest(manifest)
+    if state_path:
+        if not os.access(state_path, os.F_OK):
+            os.makedirs(state_path)
+        tmp_path = os.path.join(state_path, MANIFEST_CACHE_FILE + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((signature, pages), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, os.path.join(state_path, MANIFEST_CACHE_FILE))
+    return pages
+
+def render_file(file, files, file_provider, error_handler, templates=None, urls=None, timings=None):
+    """renders file into a list of strings, based on the given files.
+
+    compiled templates are kept in the dict templates; pass the same dict when rendering several pages so that each template is only compiled once.
+    likewise, pass the url_index of files as urls so that it isn't built again for every page.
+    if timings is a dict, the seconds spent in each phase of rendering (see BuildStats) are added to it.
+    """
+    return list(iter_render_file(file, files, file_provider, error_handler, templates, urls, timings))
+
+def iter_render_file(file, files, file_provider, error_handler, templates=None, urls=None, timings=None):
+    """renders file like render_file, but yields its lines one at a time, so that they can be written out without holding the whole page in memory"""
+    if templates is None:
+        templates = {}
+    if urls is None:
+        urls = url_index(files)
+    if timings is not None:
+        start = time.perf_counter()
+    template = load_template(file['template'], file_provider, templates)
+    if timings is not None:
+        add_time(timings, 'template', start)
+    if isinstance(template['error'], TemplateCycleError):
+        error_handler('''error: template include cycle %s in %s''' % (template['error'], file['template']))
+    elif template['error']: # included file not found
+        error_handler('''error: referenced template %s in %s not found''' % (template['error'], file['template']))
+
     try:
-        lines = replace_text_tags(lines, file, file_provider, error_handler)
+        for lines, has_urls in render_segments(template['segments'], file, file_provider, error_handler, timings):
+            if not has_urls:
+                yield from lines
+                continue
+            for line in lines:
+                if '{@' in line:
+                    if timings is not None:
+                        start = time.perf_counter()
+                    line = replace_url_tags(line, file, urls, error_handler)
+                    if timings is not None:
+                        add_time(timings, 'urls', start)
+                yield line
     except NoSuchFileError as e: # included file not found
         error_handler('''error: referenced content file %s in /%s not found''' % (e, file['path']))
         raise
 
-    for line in lines:
-        m = re.search(r'{\@' + name_re + '}', line)
+def url_index(files):
+    """returns a dict mapping each name in files to the path of the first file with that name"""
+    urls = {}
+    for f in files:
+        if 'name' in f and f['name'] not in urls:
+            urls[f['name']] = f['path']
+    return urls
+
+def replace_url_tags(line, file, urls, error_handler):
+    """replaces each {@name} tag in line with the path of the file with that name, as given by urls"""
+    def replace(m):
+        try:
+            return urls[m.group('name')]
+        except KeyError:
+            error_handler('''warning: referenced URL %s in /%s not found''' % (m.group('name'), file['path']))
+            return m.group(0)
+    return url_tag_pattern.sub(replace, line)
+
+def load_template(path, file_provider, templates, chain=()):
+    """returns the template at path compiled into a dict of its expanded lines, their segments (see compile_segments), the NoSuchFileError or TemplateCycleError raised while expanding its includes (or None), the paths it was read from (see recording_provider) and whether it has a {_now} tag.
+
+    the compiled template is taken from, or stored in, the dict templates. chain lists the templates whose includes are being expanded; if path is one of them, TemplateCycleError is raised.
+    """
+    try:
+        return templates[path]
+    except KeyError:
+        pass
+    if path in chain:
+        raise TemplateCycleError(list(chain) + [path])
+    paths = {}
+    provider = recording_provider(file_provider, paths)
+    lines = provider(path)
+    error = None
+    try:
+        lines = replace_template_tags(lines, provider, templates, chain + (path,), paths)
+    except (NoSuchFileError, TemplateCycleError) as e:
+        error = e
+    template = {'lines': lines, 'segments': compile_segments(lines), 'error': error, 'paths': paths,
+                'now': any('{_now}' in line for line in lines)}
+    if not (chain and isinstance(error, TemplateCycleError)):
+        # a template in a cycle is compiled again if used directly, so that it reports the cycle from itself
+        templates[path] = template
+    return template
+
+def compile_segments(lines):
+    """splits lines into segments, so that they can be rendered for any page without searching them for tags again.
+
+    each segment is either (LITERAL, lines, has_urls), a run of lines without {name} tags, where has_urls tells whether they contain {@name} tags, or (TEXT, name, prefix, suffix, line_number, repeated, line), a line whose first {name} tag is to be replaced, where repeated tells whether it has more {name} tags.
+    """
+    segments = []
+    run = []
+    run_has_urls = False
+    for i, line in enumerate(lines):
+        m = text_tag_pattern.search(line)
         if m:
+            if run:
+                segments.append((LITERAL, run, run_has_urls))
+                run = []
             span = m.span()
-            try:
-                url = [f['path'] for f in files if 'name' in f and f['name'] == m.group('name')][0]
-                line = line[:span[0]] + url + line[span[1]:]
-            except IndexError:
-                error_handler('''warning: referenced URL %s in /%s not found''' % (m.group('name'), file['path']))
-        ret.append(line)
-    return ret
+            repeated = text_tag_pattern.search(line, span[1]) is not None
+            segments.append((TEXT, m.group('name'), line[:span[0]], line[span[1]:], i, repeated, line))
+        else:
+            has_urls = '{@' in line
+            if run and has_urls != run_has_urls:
+                segments.append((LITERAL, run, run_has_urls))
+                run = []
+            run.append(line)
+            run_has_urls = has_urls
+    if run:
+        segments.append((LITERAL, run, run_has_urls))
+    return segments
 
 def process_replacement_lines(prefix, suffix, lines):
     """returns a list with contents of lines, with the first line prefixed with prefix, the last line suffixed with suffix, and all lines prefixed with the leading whitespace of prefix"""
@@ -99,21 +333,30 @@ def process_replacement_lines(prefix, suffix, lines):
     m = re.match(r'^(?P<ws>\s*)(?P<text>.*)$', prefix)
     ws_prefix = m.group('ws')
     prefix = m.group('text')
+    lines = list(lines) # lines may be shared by a caching file provider
     lines[0] = prefix + lines[0]
     lines[-1] = lines[-1].rstrip('\n') + suffix
     return [ws_prefix + line for line in lines]
 
-def replace_template_tags(lines, file_provider):
-    """replaces all {/path/to/template} tags with the text of the template, with the same replacement performed on the template. paths are relative to root_path, even if prefixed with /."""
+def replace_template_tags(lines, file_provider, templates=None, chain=(), paths=None):
+    """replaces all {/path/to/template} tags with the text of the template, with the same replacement performed on the template. paths are relative to root_path, even if prefixed with /.
+
+    each included template is expanded once, by load_template, and kept in the dict templates; only the indentation of each include is applied again. the paths read for the included templates are added to the dict paths, like recording_provider does.
+    chain lists the templates that lines were included from, so that an include cycle raises TemplateCycleError instead of recursing forever.
+    """
+    if templates is None:
+        templates = {}
     ret = []
     for line in lines:
-        m = re.search(r'{/' + path_re + '}', line)
+        m = include_tag_pattern.search(line)
         if m:
             span = m.span()
-            template_path = m.group('path').lstrip('/')
-            template_lines = file_provider(template_path)
-            template_lines = replace_template_tags(template_lines, file_provider)
-            ret += process_replacement_lines(line[:span[0]], line[span[1]:], template_lines)
+            template = load_template(m.group('path').lstrip('/'), file_provider, templates, chain)
+            if paths is not None:
+                paths.update(template['paths'])
+            if template['error']:
+                raise template['error']
+            ret += process_replacement_lines(line[:span[0]], line[span[1]:], template['lines'])
         else:
             ret.append(line)
     return ret
@@ -129,99 +372,1147 @@ def extract_info(lines):
 def replace_text_tags(lines, file, file_provider, error_handler):
     """replaces all {name} tags with the associated text, given the information in file."""
     ret = []
+    for chunk, has_urls in render_segments(compile_segments(lines), file, file_provider, error_handler):
+        ret += chunk
+    return ret
+
+def render_segments(segments, file, file_provider, error_handler, timings=None):
+    """yields the text of segments for file as (lines, has_urls) tuples, with each {name} slot replaced by its associated text. has_urls is False only for lines that are known to have no {@name} tags.
+    if timings is a dict, the seconds spent extracting info, replacing text tags and converting markdown are added to it."""
+    if timings is not None:
+        start = time.perf_counter()
     info = {}
-    for line in lines:
-        m = re.search(r'{' + name_re + '}', line)
-        if not m: continue
+    contents = {}
+    def read_content(filename):
+        if filename not in contents:
+            contents[filename] = file_provider(filename)
+        return contents[filename]
+    for segment in segments:
+        if segment[0] != TEXT: continue
         try:
-            filename = file['content'][m.group('name')]
+            filename = file['content'][segment[1]]
         except KeyError as e: # content tag not found in manifest; error next time
             continue
-        for k, v in list(extract_info(file_provider(filename)).items()):
+        for k, v in list(extract_info(read_content(filename)).items()):
             if k not in info:
                 info[k] = v
+    if timings is not None:
+        add_time(timings, 'info', start)
 
-    for i, line in enumerate(lines):
-        m = re.search(r'{' + name_re + '}', line)
-        if m:
-            span = m.span()
-            if re.search(r'{' + name_re + '}', line[span[1]:]):
-                # TODO fix this bug for real
-                error_handler('''warning: multiple replacements found on line %d of /%s, but only the first will be replaced''' % (i, file['path']))
-            name = m.group('name')
-            if name == '_now':
-                content_lines = [str(NOW_TIME)]
-            else:
-                try:
-                    filename = file['content'][name]
-                    content_lines = file_provider(filename)
-                    got_info = False
-                    while re.match(info_re, content_lines[0]):
-                        content_lines = content_lines[1:]
-                        got_info = True
-                    if got_info:
-                        content_lines = content_lines[1:]
-                    if filename.endswith('.markdown'):
-                        content_lines = markdown.markdown(''.join(content_lines)).splitlines(True)
-                except KeyError as e: # content tag not found in manifest
-                    try:
-                        content_lines = [info[name]]
-                    except KeyError as e: # no info found either
-                        error_handler('''warning: content tag %s found in /%s, but no replacement file or named info is specified''' % (e, file['path']))
-                        ret.append(line)
-                        continue
-            ret += process_replacement_lines(line[:span[0]], line[span[1]:], content_lines)
+    for segment in segments:
+        if segment[0] == LITERAL:
+            yield segment[1], segment[2]
+            continue
+        if timings is not None:
+            start = time.perf_counter()
+        kind, name, prefix, suffix, i, repeated, line = segment
+        if repeated:
+            # TODO fix this bug for real
+            error_handler('''warning: multiple replacements found on line %d of /%s, but only the first will be replaced''' % (i, file['path']))
+        if name == '_now':
+            content_lines = [str(NOW_TIME)]
         else:
-            ret.append(line)
-    return ret
+            try:
+                filename = file['content'][name]
+                content_lines = read_content(filename)
+                got_info = False
+                while re.match(info_re, content_lines[0]):
+                    content_lines = content_lines[1:]
+                    got_info = True
+                if got_info:
+                    content_lines = content_lines[1:]
+                if filename.endswith('.markdown'):
+                    if timings is not None:
+                        markdown_start = time.perf_counter()
+                    content_lines = markdown_cache.convert(''.join(content_lines), MARKDOWN_EXTENSIONS)
+                    if timings is not None:
+                        # not counted as text tag replacement
+                        start += add_time(timings, 'markdown', markdown_start) - markdown_start
+            except KeyError as e: # content tag not found in manifest
+                try:
+                    content_lines = [info[name]]
+                except KeyError as e: # no info found either
+                    error_handler('''warning: content tag %s found in /%s, but no replacement file or named info is specified''' % (e, file['path']))
+                    yield [line], True
+                    continue
+        content_lines = process_replacement_lines(prefix, suffix, content_lines)
+        if timings is not None:
+            add_time(timings, 'text', start)
+        yield content_lines, True
+
+class MarkdownCache(object):
+    """converts markdown to lines of html, remembering the result for up to max_entries distinct texts and extension sets.
+
+    the returned lists are shared between callers and must not be modified.
+    """
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def convert(self, text, extensions=[]):
+        key = (hashlib.sha1(text.encode('utf-8')).hexdigest(), repr(list(extensions)))
+        lines = self.entries.get(key)
+        if lines is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return lines
+        self.misses += 1
+        lines = markdown.getMarkdown(list(extensions)).convert(text).splitlines(True)
+        self.entries[key] = lines
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return lines
+
+# shared by every page rendered in this process
+markdown_cache = MarkdownCache()
+
+def add_time(timings, phase, start):
+    """adds the seconds since start (a time.perf_counter() value) to phase in the dict timings, returning the current time"""
+    now = time.perf_counter()
+    timings[phase] = timings.get(phase, 0.0) + now - start
+    return now
+
+class BuildStats(object):
+    """the time a build took, per page and per phase, and the hits and misses of its caches.
+
+    the phases are template (loading and compiling templates), info (extracting info lines), text (replacing {name} tags), markdown (converting .markdown content),
+    urls (replacing {@name} tags), cache (looking pages up in and copying them from the build cache) and write (writing pages out).
+    """
+    PHASES = ['template', 'info', 'text', 'markdown', 'urls', 'cache', 'write']
+
+    def __init__(self):
+        self.total = 0.0
+        self.checked = 0
+        self.written = 0
+        self.pages = collections.OrderedDict()
+        self.caches = collections.OrderedDict()
+
+    def add_page(self, file, timings):
+        """records the timings of building file, as collected by build_page"""
+        page = {'template': file['template'], 'total': timings.get('total', 0.0), 'cached': timings.get('cached', False), 'phases': {}}
+        for phase in self.PHASES:
+            page['phases'][phase] = timings.get(phase, 0.0)
+        self.pages[file['path']] = page
+
+    def count(self, name, hits, misses):
+        """records the hits and misses of the cache called name"""
+        self.caches[name] = {'hits': hits, 'misses': misses}
+
+    def phases(self):
+        """returns a dict of the total seconds spent in each phase"""
+        return dict((phase, sum(page['phases'][phase] for page in self.pages.values())) for phase in self.PHASES)
+
+    def templates(self):
+        """returns a dict mapping each template to the number of pages built with it and their total seconds"""
+        templates = {}
+        for page in self.pages.values():
+            template = templates.setdefault(page['template'], {'pages': 0, 'total': 0.0})
+            template['pages'] += 1
+            template['total'] += page['total']
+        return templates
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'checked': self.checked,
+            'rendered': len(self.pages),
+            'written': self.written,
+            'phases': self.phases(),
+            'caches': self.caches,
+            'templates': self.templates(),
+            'pages': self.pages,
+        }
+
+    def summary(self, limit=5):
+        """returns a report of the build for people, with the limit slowest pages and templates"""
+        lines = ['%.3fs total: %d pages checked, %d rendered, %d written' % (self.total, self.checked, len(self.pages), self.written)]
+        phases = self.phases()
+        lines.append('phases: ' + ', '.join('%s %.3fs' % (phase, phases[phase]) for phase in self.PHASES))
+        if self.caches:
+            lines.append('caches: ' + ', '.join('%s %d/%d hits' % (name, c['hits'], c['hits'] + c['misses']) for name, c in self.caches.items()))
+        if self.pages:
+            lines.append('slowest pages:')
+            for path, page in sorted(self.pages.items(), key=lambda item: -item[1]['total'])[:limit]:
+                lines.append('  %.3fs /%s%s' % (page['total'], path, ' (cached)' if page['cached'] else ''))
+            lines.append('slowest templates:')
+            for path, template in sorted(self.templates().items(), key=lambda item: -item[1]['total'])[:limit]:
+                lines.append('  %.3fs %s (%d pages)' % (template['total'], path, template['pages']))
+        return '\n'.join(lines)
+
+    def save(self, path):
+        """writes the stats to the file at path as json"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+
+def recording_provider(file_provider, used):
+    """wraps file_provider so that every path it is asked for is added to the dict used, even if it does not exist.
+
+    the value of each path is its file_signature from just before it was first read, if file_provider has a read_signed method (see CachingFileProvider), and None otherwise.
+    the returned provider has a read_signed method too, so that it can be wrapped again.
+    """
+    read_signed = getattr(file_provider, 'read_signed', None)
+    def signed(path):
+        try:
+            if read_signed is None:
+                signature, lines = None, file_provider(path)
+            else:
+                signature, lines = read_signed(path)
+        except NoSuchFileError:
+            used.setdefault(path, None)
+            raise
+        used.setdefault(path, signature)
+        return signature, lines
+    def provider(path):
+        return signed(path)[1]
+    provider.read_signed = signed
+    return provider
+
+def file_signature(path):
+    """returns a [mtime, size] signature of the file at path, or None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+def load_deps(state_path):
+    """loads the dependency graph recorded by the last build from state_path, or an empty graph if there is none"""
+    try:
+        with open(os.path.join(state_path, DEPS_FILE)) as f:
+            deps = json.load(f)
+    except (IOError, ValueError):
+        return {'names': [], 'pages': {}}
+    return deps
+
+def save_deps(state_path, deps):
+    """writes the dependency graph deps to state_path"""
+    if not os.access(state_path, os.F_OK):
+        os.makedirs(state_path)
+    tmp_path = os.path.join(state_path, DEPS_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(deps, f)
+    os.replace(tmp_path, os.path.join(state_path, DEPS_FILE))
+
+def page_is_stale(file, record, root_path, has_output):
+    """returns True if file must be re-rendered: it has no record from a previous build, its manifest entry changed, its output is missing (has_output is False), it has the time of the build in it, or any file it used changed"""
+    if record is None or record['entry'] != file.as_dict():
+        return True
+    if record.get('now'):
+        return True
+    if not has_output:
+        return True
+    for path, signature in record['deps'].items():
+        if file_signature(os.path.join(root_path, path)) != signature:
+            return True
+    return False
+
+def page_cache_key(file, files, file_provider, templates):
+    """returns a hash of everything the rendered output of file depends on: its manifest entry, its expanded template, its content files, the markdown extensions in use and the {@name} urls of the site.
+
+    returns None if the page can't be cached because one of its inputs is missing; rendering it will report the error.
+    """
+    h = hashlib.sha1()
+    def add(text):
+        h.update(text.encode('utf-8'))
+        h.update(b'\0')
+    add(str(CACHE_VERSION))
+    add(json.dumps(file.as_dict(), sort_keys=True))
+    add(json.dumps(sorted(MARKDOWN_EXTENSIONS)))
+    add(json.dumps([[f['name'], f['path']] for f in files if 'name' in f]))
+    try:
+        template = load_template(file['template'], file_provider, templates)
+        if template['error']:
+            return None
+        add(''.join(template['lines']))
+        if template['now']:
+            add(str(NOW_TIME))
+        for name, path in sorted(file.get('content', {}).items()):
+            add(name)
+            add(''.join(file_provider(path)))
+    except NoSuchFileError:
+        return None
+    return h.hexdigest()
+
+def cache_file_for(state_path, key):
+    """returns the path of the build cache entry for key"""
+    return os.path.join(state_path, CACHE_DIR, key[:2], key)
+
+def read_cache(state_path, key):
+    """returns the errors reported while rendering the page stored in the build cache under key, or None if there is no such entry"""
+    cache_file_path = cache_file_for(state_path, key)
+    if not os.access(cache_file_path, os.F_OK):
+        return None
+    try:
+        with open(cache_file_path + '.errors') as f:
+            errors = json.load(f)
+    except (IOError, ValueError):
+        return None
+    try:
+        os.utime(cache_file_path) # see prune_cache
+    except OSError:
+        pass
+    return errors
+
+def write_cache(state_path, key, rendered_path, errors, body=None):
+    """stores the page rendered to rendered_path (or, if given, the rendered bytes body), and the errors reported while rendering it, in the build cache under key"""
+    cache_file_path = cache_file_for(state_path, key)
+    if not os.access(os.path.dirname(cache_file_path), os.F_OK):
+        os.makedirs(os.path.dirname(cache_file_path), exist_ok=True)
+    tmp_path = '%s.%d.tmp' % (cache_file_path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(errors, f)
+    os.replace(tmp_path, cache_file_path + '.errors')
+    if body is not None:
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+    else:
+        shutil.copyfile(rendered_path, tmp_path)
+    os.replace(tmp_path, cache_file_path)
+
+def prune_cache(state_path, max_bytes=None):
+    """removes the least recently used entries of the build cache under state_path until the rest take up at most max_bytes (by default, CACHE_MAX_BYTES). returns the number of entries removed.
+    an entry's mtime is the last time it was written or read (see read_cache).
+    """
+    if max_bytes is None:
+        max_bytes = CACHE_MAX_BYTES
+    cache_path = os.path.join(state_path, CACHE_DIR)
+    entries = []
+    total = 0
+    try:
+        dirnames = os.listdir(cache_path)
+    except OSError:
+        return 0
+    for dirname in dirnames:
+        try:
+            names = os.listdir(os.path.join(cache_path, dirname))
+        except OSError:
+            continue
+        for name in names:
+            if name.endswith('.errors') or name.endswith('.tmp'):
+                continue
+            path = os.path.join(cache_path, dirname, name)
+            try:
+                st = os.stat(path)
+                size = st.st_size + os.stat(path + '.errors').st_size
+            except OSError:
+                continue
+            entries.append((st.st_mtime_ns, size, path))
+            total += size
+    removed = 0
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        for entry_path in [path, path + '.errors']:
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+        total -= size
+        removed += 1
+    return removed
+
+def file_hash(path):
+    """returns the sha1 hexdigest of the contents of the file at path"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def same_contents(path, other_path):
+    """returns True if the files at path and other_path both exist and have the same contents"""
+    try:
+        if os.stat(path).st_size != os.stat(other_path).st_size:
+            return False
+    except OSError:
+        return False
+    return file_hash(path) == file_hash(other_path)
+
+def replace_if_changed(tmp_path, out_file_path):
+    """moves tmp_path to out_file_path, unless out_file_path already has the same contents; then tmp_path is removed instead, leaving out_file_path and its mtime alone. returns True if out_file_path was written."""
+    if same_contents(tmp_path, out_file_path):
+        os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, out_file_path)
+    return True
+
+def tmp_file_for(out_file_path):
+    """returns the path a page is written to before it replaces out_file_path"""
+    dirname, basename = os.path.split(out_file_path)
+    return os.path.join(dirname, '.%s.%d.tmp' % (basename, os.getpid()))
+
+def is_compressible(path):
+    """returns True if the output file at path is text, and worth precompressing"""
+    ctype = mimetypes.guess_type(path)[0]
+    return ctype is not None and (ctype.startswith('text/') or ctype in COMPRESSIBLE_TYPES)
+
+def compress_bytes(data, encoding):
+    """returns data compressed with encoding, one of COMPRESSION_ENCODINGS"""
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=19).compress(data)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def compress_file(path, encodings=COMPRESSION_ENCODINGS):
+    """writes a sibling of the file at path compressed with each of encodings, if it is compressible.
+    a sibling has the same mtime as the file it was compressed from, and is only written again when that changes.
+
+    returns the paths of the siblings that were written.
+    """
+    if not is_compressible(path):
+        return []
+    st = os.stat(path)
+    data = None
+    written = []
+    for encoding in encodings:
+        sibling = path + COMPRESSED_SUFFIXES[encoding]
+        try:
+            if os.stat(sibling).st_mtime_ns == st.st_mtime_ns:
+                continue
+        except OSError:
+            pass
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        tmp_path = tmp_file_for(sibling)
+        with open(tmp_path, 'wb') as f:
+            f.write(compress_bytes(data, encoding))
+        os.utime(tmp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(tmp_path, sibling)
+        written.append(sibling)
+    return written
+
+def remove_compressed(path):
+    """removes any precompressed siblings of the file at path"""
+    for suffix in COMPRESSED_SUFFIXES.values():
+        if os.access(path + suffix, os.F_OK):
+            os.remove(path + suffix)
+
+def depends_on(deps, changed):
+    """returns True if any path in deps, or any directory containing it, is in the set changed"""
+    for path in deps:
+        while path:
+            if path in changed:
+                return True
+            path = os.path.dirname(path)
+    return False
+
+def is_ignored_change(root_path, path):
+    """returns True if a change to path can't affect the site at root_path: it is in out/ or the build state, or it is an editor's swap or backup file"""
+    relpath = os.path.relpath(path, root_path)
+    top = relpath.split(os.sep)[0]
+    if top == 'out' or top == STATE_DIR:
+        return True
+    name = os.path.basename(path)
+    return any(fnmatch.fnmatch(name, pattern) for pattern in IGNORED_FILE_PATTERNS)
+
+def changed_paths(root_path, event_type, is_directory, src_path, dest_path=None):
+    """returns the paths, relative to root_path, of the changes in a filesystem event that may affect the site at root_path.
+
+    a directory is only modified when an entry in it is added, removed or renamed, and those report their own events, so such events are dropped:
+    otherwise an editor's swap file would mark every page that depends on a file in the same directory as changed.
+    """
+    if event_type not in ('created', 'deleted', 'modified', 'moved'):
+        return [] # e.g. files opened while rendering
+    if is_directory and event_type == 'modified':
+        return []
+    return [os.path.relpath(path, root_path) for path in [src_path, dest_path] if path and not is_ignored_change(root_path, path)]
+
+class Debouncer(object):
+    """collects items added in bursts, calling callback with the set of them once delay seconds pass without another being added.
+
+    calls to callback never overlap; items added while it runs are passed to the next call.
+    """
+    def __init__(self, callback, delay=0.2):
+        self.callback = callback
+        self.delay = delay
+        self.items = set()
+        self.timer = None
+        self.lock = threading.Lock()
+        self.running = threading.Lock()
+
+    def add(self, item):
+        with self.lock:
+            self.items.add(item)
+            if self.timer:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        with self.running:
+            with self.lock:
+                items, self.items = self.items, set()
+                self.timer = None
+            if items:
+                self.callback(items)
+
+def out_file_for(out_path, file):
+    """returns the path of the output file for file under out_path"""
+    out_file_path = os.path.join(out_path, file['path'])
+    if out_file_path.endswith('/'):
+        out_file_path += 'index.html'
+    return out_file_path
+
+def page_store_path(file):
+    """returns the path under which file is kept in a PageStore: the path of its output file relative to the output directory"""
+    return os.path.normpath(out_file_for('', file))
+
+StoredPage = collections.namedtuple('StoredPage', 'body etag mtime')
+
+class PageStore(object):
+    """the rendered pages of a site, kept in memory for the preview server instead of being written to files.
+
+    pages are StoredPages keyed by page_store_path. update replaces the whole map at once, so readers never see a partly rebuilt site.
+    """
+    def __init__(self):
+        self.pages = {}
+        self.deps = {'names': [], 'pages': {}}
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        """returns the StoredPage at path, or None"""
+        return self.pages.get(path)
+
+    def changes(self, path, body):
+        """returns True if body differs from the page stored at path"""
+        page = self.pages.get(path)
+        return page is None or page.body != body
+
+    def update(self, bodies, deps, paths):
+        """stores the rendered pages in the dict bodies, and drops any page whose path is not in paths. deps records the inputs of the stored pages, like deps.json."""
+        paths = set(paths)
+        with self.lock:
+            pages = dict((path, page) for path, page in self.pages.items() if path in paths)
+            now = time.time()
+            for path, body in bodies.items():
+                if self.changes(path, body):
+                    pages[path] = StoredPage(body, '"%s"' % hashlib.sha1(body).hexdigest(), now)
+            self.pages = pages
+            self.deps = deps
+
+class ReloadNotifier(object):
+    """passes the paths of output files changed by each build to the preview server's live reload clients"""
+    def __init__(self, history=64):
+        self.condition = threading.Condition()
+        self.version = 0
+        self.events = collections.deque(maxlen=history)
+        self.closed = False
+
+    def notify(self, paths):
+        """tells waiting clients that the output files at paths changed"""
+        if not paths:
+            return
+        with self.condition:
+            self.version += 1
+            self.events.append((self.version, list(paths)))
+            self.condition.notify_all()
+
+    def wait(self, version, timeout=None):
+        """waits up to timeout seconds for a notification after version.
+
+        returns a tuple (version, paths): the latest version and the paths changed since the given one, which are empty on a timeout and None once the notifier is closed.
+        if the changes are too old to be remembered, paths is ['*'].
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.version > version or self.closed, timeout)
+            if self.closed:
+                return version, None
+            if self.version > version and self.events[0][0] > version + 1:
+                return self.version, ['*']
+            paths = []
+            for event_version, event_paths in self.events:
+                if event_version > version:
+                    paths.extend(path for path in event_paths if path not in paths)
+            return self.version, paths
+
+    def close(self):
+        """ends every wait, e.g. when the server shuts down"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+def inject_reload_script(html):
+    """returns the html page (as bytes) with RELOAD_SCRIPT added before its closing body tag, or at the end if it has none"""
+    end = html.lower().rfind(b'</body>')
+    if end == -1:
+        end = len(html)
+    return html[:end] + RELOAD_SCRIPT + html[end:]
+
+class CachingFileProvider(object):
+    """a file provider that reads paths relative to root_path, keeping the lines of up to max_entries files in memory.
+
+    a file is read again only when its stat results change, so one provider can be shared by every page of a build and across builds.
+    the returned lists are shared between callers and must not be modified.
+    """
+    def __init__(self, root_path, max_entries=4096):
+        self.root_path = root_path
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, path):
+        return self.read_signed(path)[1]
+
+    def read_signed(self, path):
+        """returns a tuple of the file_signature of path, taken before it was read, and its lines"""
+        full_path = os.path.join(self.root_path, path)
+        try:
+            st = os.stat(full_path)
+        except OSError as e:
+            self.entries.pop(path, None)
+            raise NoSuchFileError(e.filename)
+        signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        entry = self.entries.get(path)
+        if entry and entry[0] == signature:
+            self.entries.move_to_end(path)
+            self.hits += 1
+            return [st.st_mtime_ns, st.st_size], entry[1]
+        try:
+            with open(full_path) as f:
+                lines = f.readlines()
+        except IOError as e:
+            raise NoSuchFileError(e.filename)
+        self.misses += 1
+        self.entries[path] = (signature, lines)
+        self.entries.move_to_end(path)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return [st.st_mtime_ns, st.st_size], lines
+
+def page_inputs(file, files, file_provider, templates, state_path, cache, timings=None):
+    """returns a tuple (used, page_provider, key) for building file: the dict that the paths read for it are recorded in (see recording_provider), a file provider that records them, and its build cache key (or None)"""
+    used = {}
+    page_provider = recording_provider(file_provider, used)
+    if timings is not None:
+        start = time.perf_counter()
+    try:
+        # a template compiled for an earlier page won't be read through page_provider again
+        used.update(load_template(file['template'], page_provider, templates)['paths'])
+    except NoSuchFileError:
+        pass # reported by iter_render_file
+    if timings is not None:
+        start = add_time(timings, 'template', start)
+    key = page_cache_key(file, files, page_provider, templates) if cache else None
+    if timings is not None:
+        add_time(timings, 'cache', start)
+    return used, page_provider, key
+
+def build_page(file, files, urls, file_provider, templates, state_path, cache, out_file_path, timings=None):
+    """renders file to out_file_path, or copies it there from the build cache if cache is True. urls is the url_index of files, and compiled templates are shared through the dict templates.
+    out_file_path is only written if its contents change. if timings is a dict, the seconds spent in each phase of the build are added to it, and its 'cached' key is set.
+
+    returns a tuple (errors, used, failure, written): the errors reported while rendering, the paths read (see page_inputs), a description of the exception that stopped rendering (or None), and whether out_file_path was written.
+    """
+    used, page_provider, key = page_inputs(file, files, file_provider, templates, state_path, cache, timings)
+    if timings is not None:
+        start = time.perf_counter()
+    errors = read_cache(state_path, key) if key else None
+    if not os.access(os.path.dirname(out_file_path), os.F_OK):
+        os.makedirs(os.path.dirname(out_file_path), exist_ok=True)
+    tmp_path = tmp_file_for(out_file_path)
+    if errors is not None:
+        if timings is not None:
+            timings['cached'] = True
+        cache_file_path = cache_file_for(state_path, key)
+        try:
+            if same_contents(cache_file_path, out_file_path):
+                return errors, used, None, False
+            shutil.copyfile(cache_file_path, tmp_path)
+            os.replace(tmp_path, out_file_path)
+            return errors, used, None, True
+        finally:
+            if timings is not None:
+                add_time(timings, 'cache', start)
+    if timings is not None:
+        timings['cached'] = False
+        add_time(timings, 'cache', start)
+    errors = []
+    try:
+        with open(tmp_path, 'w') as out_file:
+            lines = iter_render_file(file, files, page_provider, errors.append, templates, urls, timings)
+            if timings is None:
+                out_file.writelines(lines)
+            else:
+                for line in lines:
+                    start = time.perf_counter()
+                    out_file.write(line)
+                    add_time(timings, 'write', start)
+                start = time.perf_counter()
+    except Exception as e:
+        if os.access(tmp_path, os.F_OK):
+            os.remove(tmp_path)
+        return errors, used, '%s: %s\n%s' % (file, e, traceback.format_exc()), False
+    if key:
+        write_cache(state_path, key, tmp_path, errors)
+    written = replace_if_changed(tmp_path, out_file_path)
+    if timings is not None:
+        add_time(timings, 'write', start) # including closing the file
+    return errors, used, None, written
+
+def build_page_in_memory(file, files, urls, file_provider, templates, state_path, cache, timings=None):
+    """renders file, or reads it from the build cache if cache is True, without writing it to the output directory.
+
+    returns a tuple (errors, used, failure, body) like build_page, with the rendered page as bytes (or None, if rendering failed) in place of written.
+    """
+    used, page_provider, key = page_inputs(file, files, file_provider, templates, state_path, cache, timings)
+    if timings is not None:
+        start = time.perf_counter()
+    errors = read_cache(state_path, key) if key else None
+    if timings is not None:
+        timings['cached'] = errors is not None
+    if errors is not None:
+        with open(cache_file_for(state_path, key), 'rb') as f:
+            body = f.read()
+        if timings is not None:
+            add_time(timings, 'cache', start)
+        return errors, used, None, body
+    if timings is not None:
+        add_time(timings, 'cache', start)
+    errors = []
+    try:
+        body = ''.join(iter_render_file(file, files, page_provider, errors.append, templates, urls, timings)).encode('utf-8')
+    except Exception as e:
+        return errors, used, '%s: %s\n%s' % (file, e, traceback.format_exc()), None
+    if key:
+        write_cache(state_path, key, None, errors, body=body)
+    return errors, used, None, body
+
+_worker = {}
 
-def render_from_manifest(manifest_path):
-    """renders the site defined in the manifest at manifest_path to files"""
+def _init_worker(root_path, files, state_path, cache, out_path, timed):
+    """sets up a build_page worker process for the site at root_path"""
+    _worker['files'] = files
+    _worker['urls'] = url_index(files)
+    _worker['file_provider'] = CachingFileProvider(root_path)
+    _worker['templates'] = {}
+    _worker['state_path'] = state_path
+    _worker['cache'] = cache
+    _worker['out_path'] = out_path
+    _worker['timed'] = timed
+
+def _build_page_in_worker(file):
+    return timed_build(file, _worker['files'], _worker['urls'], _worker['file_provider'], _worker['templates'], _worker['state_path'], _worker['cache'], _worker['out_path'], _worker['timed'])
+
+def timed_build(file, files, urls, file_provider, templates, state_path, cache, out_path, timed):
+    """builds file with build_page, or with build_page_in_memory if out_path is None. returns a tuple of the result and, if timed is True, the timings of the build (or None)."""
+    timings = {} if timed else None
+    if timed:
+        start = time.perf_counter()
+    if out_path is None:
+        result = build_page_in_memory(file, files, urls, file_provider, templates, state_path, cache, timings)
+    else:
+        result = build_page(file, files, urls, file_provider, templates, state_path, cache, out_file_for(out_path, file), timings)
+    if timed:
+        add_time(timings, 'total', start)
+    return result, timings
+
+def render_from_manifest(manifest_path, force=False, cache=True, jobs=1, file_provider=None, changed=None, page_store=None, written_handler=None, compress=False, stats=None):
+    """renders the site defined in the manifest at manifest_path to files, and reports how many were written and how many were left unchanged.
+
+    only pages whose manifest entry, template, included templates or content files changed since the last build are rendered, unless force is True.
+    if cache is True, the parsed manifest is cached under .grizz, and pages whose inputs hash to an entry in the build cache under .grizz/cache are copied from it instead of being rendered.
+    the build cache is pruned to CACHE_MAX_BYTES after each successful build (see prune_cache).
+    if jobs is more than 1, pages are rendered by that many worker processes; their errors are still reported in manifest order.
+    file_provider reads the templates and content files; pass the same CachingFileProvider to successive builds of a site to reuse the files it read.
+    if changed is given, it lists the only paths (relative to the manifest's directory) that changed since the last build, e.g. as reported by a filesystem watcher; then only pages that depend on one of them are checked and rendered.
+    if page_store is given, pages are rendered into that PageStore instead of to files, and it is updated all at once when the build succeeds.
+    written_handler, if given, is called with the page_store_path of each page whose output changed.
+    if compress is True, every compressible page gets precompressed siblings (see compress_file) that are brought up to date with it; pages in a page_store are not compressed.
+    if stats is a BuildStats, the timings of each page built and the hits and misses of the caches are recorded in it. the file and markdown caches of worker processes are not counted.
+    """
+    build_start = time.perf_counter()
     root_path = os.path.dirname(manifest_path)
     out_path = os.path.join(root_path, 'out')
+    state_path = os.path.join(root_path, STATE_DIR)
     if not os.access(out_path, os.F_OK):
         os.mkdir(out_path)
+    if page_store is not None:
+        out_path = None
 
-    def file_provider(path):
-        try:
-            with open(os.path.join(root_path, path)) as f:
-                return f.readlines();
-        except IOError as e:
-            raise NoSuchFileError(e.filename)
+    if file_provider is None:
+        file_provider = CachingFileProvider(root_path)
+    file_counts = (getattr(file_provider, 'hits', 0), getattr(file_provider, 'misses', 0))
+    markdown_counts = (markdown_cache.hits, markdown_cache.misses)
+    templates = {}
     def error_handler(s):
         print(s)
 
-    with open(manifest_path) as manifest:
-        files = manifest_to_files(manifest)
+    files = load_manifest(manifest_path, state_path if cache else None)
+    urls = url_index(files)
+
+    # the deps of pages in a PageStore live with it, not with the files in out/
+    old_deps = load_deps(state_path) if page_store is None else page_store.deps
+    deps = {'names': [[f['name'], f['path']] for f in files if 'name' in f], 'pages': {}}
+    if deps['names'] != old_deps['names']:
+        # {@name} links may resolve differently on any page
+        force = True
+
+    if changed is not None:
+        changed = set(changed)
+        if os.path.basename(manifest_path) in changed:
+            changed = None
+
+    stale = []
     for f in files:
-        try:
-            lines = render_file(f, files, file_provider, error_handler)
-        except Exception as e:
-            print('%s: %s\n%s' % (f, e, traceback.format_exc()))
-            return False
-        out_file_path = os.path.join(out_path, f['path'])
-        if out_file_path.endswith('/'):
-            out_file_path += 'index.html'
-        if not os.access(os.path.dirname(out_file_path), os.F_OK):
-            os.makedirs(os.path.dirname(out_file_path))
-        with open(out_file_path, 'w') as out_file:
-            out_file.writelines(lines)
+        record = old_deps['pages'].get(f['path'])
+        if changed is not None and not force and record and record['entry'] == f.as_dict() and not record.get('now'):
+            is_stale = depends_on(record['deps'], changed)
+        else:
+            if page_store is None:
+                has_output = os.access(out_file_for(out_path, f), os.F_OK)
+            else:
+                has_output = page_store.get(page_store_path(f)) is not None
+            is_stale = force or page_is_stale(f, record, root_path, has_output)
+        if not is_stale:
+            deps['pages'][f['path']] = record
+        else:
+            stale.append(f)
+
+    pool = None
+    if jobs > 1 and len(stale) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(jobs, len(stale)), _init_worker, (root_path, files, state_path, cache, out_path, stats is not None))
+        results = pool.imap(_build_page_in_worker, stale, chunksize=max(1, len(stale) // (jobs * 4)))
+    else:
+        results = (timed_build(f, files, urls, file_provider, templates, state_path, cache, out_path, stats is not None) for f in stale)
+    # the signatures of a page's inputs are taken as they are read for it, unless file_provider can't report them
+    signed = pool is not None or hasattr(file_provider, 'read_signed')
+    written = 0
+    bodies = {}
+    finished = False
+    try:
+        for f, ((errors, used, failure, page_written), timings) in zip(stale, results):
+            if stats is not None:
+                stats.add_page(f, timings)
+            for error in errors:
+                error_handler(error)
+            if failure:
+                print(failure)
+                return False
+            if page_store is not None:
+                bodies[page_store_path(f)] = page_written
+                page_written = page_store.changes(page_store_path(f), page_written)
+            if page_written:
+                written += 1
+                if written_handler:
+                    written_handler(page_store_path(f))
+            if not signed:
+                used = dict((path, file_signature(os.path.join(root_path, path))) for path in used)
+            record = deps['pages'][f['path']] = {
+                'entry': f.as_dict(),
+                'deps': used,
+            }
+            # {_now} changes with every build, so such pages are always stale
+            if load_template(f['template'], file_provider, templates)['now']:
+                record['now'] = True
+        finished = True
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+        if page_store is None:
+            save_deps(state_path, deps)
+        elif finished:
+            # a failed build leaves the store as it was, rather than half rebuilt
+            page_store.update(bodies, deps, [page_store_path(f) for f in files])
+        if stats is not None:
+            cached = sum(1 for page in stats.pages.values() if page['cached'])
+            if cache:
+                stats.count('build', cached, len(stats.pages) - cached)
+            stats.count('file', getattr(file_provider, 'hits', 0) - file_counts[0], getattr(file_provider, 'misses', 0) - file_counts[1])
+            stats.count('markdown', markdown_cache.hits - markdown_counts[0], markdown_cache.misses - markdown_counts[1])
+            stats.checked = len(files)
+            stats.written = written
+            stats.total = time.perf_counter() - build_start
+    if cache and stale:
+        prune_cache(state_path)
+    if compress and page_store is None:
+        for f in files:
+            compress_file(out_file_for(out_path, f))
+    print('%d pages written, %d unchanged' % (written, len(files) - written))
     return True
 
-def serve(out_path):
-    """starts a webserver at localhost:8080 serving the contents of the rendered site"""
-    from http.server import HTTPServer
-    from http.server import SimpleHTTPRequestHandler
+def copy_asset(src, dst, link=None):
+    """copies the file src to dst, keeping its mtime. if link is 'hardlink' or 'reflink', dst is made a hard link to src or a copy-on-write clone of it instead, where the filesystem allows."""
+    tmp_path = tmp_file_for(dst)
+    if link == 'hardlink':
+        try:
+            os.link(src, tmp_path)
+            os.replace(tmp_path, dst)
+            return
+        except OSError: # e.g. src and dst are on different filesystems
+            pass
+    elif link == 'reflink':
+        try:
+            import fcntl
+            FICLONE = 0x40049409
+            with open(src, 'rb') as src_file, open(tmp_path, 'wb') as tmp_file:
+                fcntl.ioctl(tmp_file.fileno(), FICLONE, src_file.fileno())
+            shutil.copystat(src, tmp_path)
+            os.replace(tmp_path, dst)
+            return
+        except (ImportError, OSError): # not supported on this platform or filesystem
+            pass
+    shutil.copy2(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+def asset_is_current(src, dst, checksum=False):
+    """returns True if dst is already an up to date copy of src: it has the same size, and the same mtime or (if checksum is True) the same contents"""
+    try:
+        src_st = os.stat(src)
+        dst_st = os.stat(dst)
+    except OSError:
+        return False
+    if src_st.st_size != dst_st.st_size:
+        return False
+    if (src_st.st_dev, src_st.st_ino) == (dst_st.st_dev, dst_st.st_ino):
+        return True
+    if checksum:
+        return file_hash(src) == file_hash(dst)
+    return src_st.st_mtime_ns == dst_st.st_mtime_ns
+
+def asset_stamp(path):
+    """returns a list [size, mtime_ns, inode] identifying the file at path as sync_assets left it, or None if it doesn't exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+def sync_assets(in_path, out_path, state_path, link=None, checksum=False, compress=False):
+    """copies the files under in_path to the same paths under out_path, skipping those that are already up to date (see asset_is_current).
+
+    symlinked directories under in_path are followed. link is passed to copy_asset. files copied by an earlier sync that no longer exist under in_path are removed from out_path,
+    unless they have been replaced or changed since (e.g. by a rendered page at the same path).
+    if compress is True, compressible files get precompressed siblings, which are only written again when the file is (see compress_file).
+    returns a tuple (copied, unchanged, removed) of lists of paths relative to out_path.
+    """
+    copied, unchanged, removed = [], [], []
+    synced = {}
+    for dirpath, dirnames, filenames in os.walk(in_path, followlinks=True):
+        # symlinked directories are copied like any other, unless they link back to one of their parents
+        real_dirpath = os.path.realpath(dirpath)
+        for name in list(dirnames):
+            target = os.path.realpath(os.path.join(dirpath, name))
+            if real_dirpath == target or real_dirpath.startswith(target + os.sep):
+                dirnames.remove(name)
+        dirnames.sort()
+        reldir = os.path.relpath(dirpath, in_path)
+        out_dir = os.path.normpath(os.path.join(out_path, reldir))
+        if not os.access(out_dir, os.F_OK):
+            os.makedirs(out_dir)
+        for name in sorted(filenames):
+            relpath = os.path.normpath(os.path.join(reldir, name))
+            src = os.path.join(dirpath, name)
+            dst = os.path.join(out_dir, name)
+            if asset_is_current(src, dst, checksum):
+                unchanged.append(relpath)
+            else:
+                copy_asset(src, dst, link)
+                copied.append(relpath)
+            synced[relpath] = asset_stamp(dst)
+            if compress:
+                compress_file(dst)
+
+    try:
+        with open(os.path.join(state_path, ASSETS_FILE)) as f:
+            previous = json.load(f)
+    except (IOError, ValueError):
+        previous = {}
+    if not isinstance(previous, dict):
+        previous = {}
+    for relpath, stamp in previous.items():
+        if relpath not in synced and stamp is not None and asset_stamp(os.path.join(out_path, relpath)) == stamp:
+            os.remove(os.path.join(out_path, relpath))
+            remove_compressed(os.path.join(out_path, relpath))
+            removed.append(relpath)
+
+    if not os.access(state_path, os.F_OK):
+        os.makedirs(state_path)
+    tmp_path = os.path.join(state_path, ASSETS_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(synced, f)
+    os.replace(tmp_path, os.path.join(state_path, ASSETS_FILE))
+    return copied, unchanged, removed
+
+class PreviewRequestHandler(SimpleHTTPRequestHandler):
+    """serves files from the rendered site over keep-alive connections, answering conditional requests with 304s.
+    pages in the server's page_store, if it has one, are served from memory in place of the files under the output directory.
+    if the server has a reload_notifier, html pages get RELOAD_SCRIPT, and RELOAD_EVENTS_PATH streams its notifications."""
+    protocol_version = 'HTTP/1.1'
+
+    def send_head(self):
+        url_path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        if self.server.reload_notifier is not None and url_path == RELOAD_EVENTS_PATH and self.command == 'GET':
+            self.send_reload_events(self.server.reload_notifier)
+            return None
+        page_store = self.server.page_store
+        if page_store is not None:
+            store_path = posixpath.normpath(url_path).lstrip('/')
+            if store_path in ('', '.'):
+                store_path = 'index.html'
+            elif url_path.endswith('/'):
+                store_path = posixpath.join(store_path, 'index.html')
+            page = page_store.get(store_path)
+            if page is not None:
+                return self.send_body(store_path, page.etag, page.mtime, page.body)
+            if page_store.get(posixpath.join(store_path, 'index.html')) is not None:
+                self.send_response(301)
+                self.send_header('Location', url_path + '/')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            if not self.path.split('?', 1)[0].endswith('/'):
+                return SimpleHTTPRequestHandler.send_head(self) # redirects to the directory
+            for index in ('index.html', 'index.htm'):
+                if os.path.isfile(os.path.join(path, index)):
+                    path = os.path.join(path, index)
+                    break
+            else:
+                return SimpleHTTPRequestHandler.send_head(self) # directory listing
+        encoding, body_path = self.find_compressed(path)
+        try:
+            f = open(body_path, 'rb')
+        except OSError:
+            self.send_error(404, 'File not found')
+            return None
+        try:
+            st = os.fstat(f.fileno())
+            etag = '"%x-%x%s"' % (st.st_mtime_ns, st.st_size, '-' + encoding if encoding else '')
+            return self.send_body(path, etag, st.st_mtime, f, encoding)
+        except:
+            f.close()
+            raise
+
+    def find_compressed(self, path):
+        """returns a tuple (encoding, path) of an up to date precompressed sibling of the file at path in an encoding the client accepts, or (None, path) if there is none"""
+        if not is_compressible(path) or (self.server.reload_notifier is not None and self.guess_type(path) == 'text/html'):
+            return None, path # html is rewritten by send_body
+        accepted = {}
+        for item in self.headers.get('Accept-Encoding', '').split(','):
+            name, _, params = item.partition(';')
+            q = params.strip()[2:] if params.strip().startswith('q=') else '1'
+            try:
+                accepted[name.strip().lower()] = float(q) > 0
+            except ValueError:
+                pass
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None, path
+        for encoding, suffix in COMPRESSED_SUFFIXES.items():
+            if accepted.get(encoding, accepted.get('*', False)):
+                try:
+                    if os.stat(path + suffix).st_mtime_ns == mtime:
+                        return encoding, path + suffix
+                except OSError:
+                    pass
+        return None, path
+
+    def send_body(self, path, etag, mtime, body, encoding=None):
+        """sends the headers for a response with the contents body of the file at path, returning a file to read the response body from (or None).
+        body is either bytes or an open file, which is closed if it isn't returned. encoding is the Content-Encoding of body, if it is compressed."""
+        ctype = self.guess_type(path)
+        if self.server.reload_notifier is not None and ctype == 'text/html':
+            if not isinstance(body, bytes):
+                with body:
+                    body = body.read()
+            body = inject_reload_script(body)
+            etag = etag[:-1] + '-reload"'
+        last_modified = self.date_time_string(mtime)
+        if self.not_modified(etag, mtime):
+            if not isinstance(body, bytes):
+                body.close()
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.end_headers()
+            return None
+        if isinstance(body, bytes):
+            length = len(body)
+            body = io.BytesIO(body)
+        else:
+            length = os.fstat(body.fileno()).st_size
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if is_compressible(path):
+            self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Content-Length', str(length))
+        self.send_header('Last-Modified', last_modified)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache') # always revalidate, since the site is rebuilt underneath
+        self.end_headers()
+        return body
+
+    def send_reload_events(self, notifier):
+        """streams the paths changed by each build to the client as server-sent events, until it disconnects or notifier is closed"""
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        version = notifier.version
+        try:
+            self.wfile.write(b'retry: 1000\n\n')
+            while True:
+                version, paths = notifier.wait(version, RELOAD_KEEPALIVE)
+                if paths is None:
+                    break
+                elif paths:
+                    self.wfile.write(('data: %s\n\n' % json.dumps(paths)).encode('utf-8'))
+                else:
+                    self.wfile.write(b': keepalive\n\n') # finds clients that went away
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def not_modified(self, etag, mtime):
+        """returns True if the request's validators show the client already has the current version"""
+        if 'If-None-Match' in self.headers:
+            tags = [tag.strip() for tag in self.headers['If-None-Match'].split(',')]
+            return etag in tags or '*' in tags
+        if 'If-Modified-Since' in self.headers:
+            try:
+                since = email.utils.parsedate_to_datetime(self.headers['If-Modified-Since'])
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+            return since is not None and int(mtime) <= since.timestamp()
+        return False
+
+    def copyfile(self, source, outputfile):
+        """sends source straight from the file to the socket, without copying it through userspace where possible"""
+        if not isinstance(source, io.BytesIO):
+            self.wfile.flush()
+            self.connection.sendfile(source)
+        else:
+            SimpleHTTPRequestHandler.copyfile(self, source, outputfile)
 
-    class Handler(SimpleHTTPRequestHandler):
-        def translate_path(self, path):
-            tpath = SimpleHTTPRequestHandler.translate_path(self, out_path + path)
-            return tpath
+def make_server(out_path, port=8080, page_store=None, reload_notifier=None):
+    """returns a threaded webserver at localhost:port serving the contents of the rendered site, and the pages in page_store if given.
+    if reload_notifier is given, pages reload themselves when it reports they changed."""
+    server = ThreadingHTTPServer(('', port), functools.partial(PreviewRequestHandler, directory=out_path))
+    server.page_store = page_store
+    server.reload_notifier = reload_notifier
+    return server
 
+def serve(out_path, port=8080, page_store=None, reload_notifier=None):
+    """starts a webserver at localhost:port serving the contents of the rendered site; see make_server"""
+    server = make_server(out_path, port, page_store, reload_notifier)
     try:
-        server = HTTPServer(('', 8080), Handler)
-        print('started server at localhost:8080 (ctrl-c to quit)...')
+        print('started server at localhost:%d (ctrl-c to quit)...' % port)
         server.serve_forever()
     except KeyboardInterrupt:
         print('^C received, shutting down server')
-        server.socket.close()
+        if reload_notifier is not None:
+            reload_notifier.close()
+        server.server_close()
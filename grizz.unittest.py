@@ -1,7 +1,18 @@
 import unittest
+import grizz
 from grizz import *
 import os
 import difflib
+import gzip
+import hashlib
+import http.client
+import io
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
 
 class GrizzRenderTest(unittest.TestCase):
     def setUp(self):
@@ -142,5 +153,1053 @@ class GrizzTextInfoReplaceTest(unittest.TestCase):
         self.assertEqual(extract_info(self.file_provider('info.txt')), {'title': 'foo', 'summary': 'you get a summary'})
         self.assertEqual(extract_info(self.file_provider('no-info.txt')), {})
 
+class GrizzManifestTest(unittest.TestCase):
+    manifest = '''/directory/file.html:
+    templates/file.html
+    main: content/main.markdown
+    footer: content/footer.markdown
+
+/index.html: (home)
+    templates/index.html
+'''.splitlines(True)
+
+    def test_parse_manifest(self):
+        pages = parse_manifest(self.manifest)
+        self.assertEqual([page.line for page in pages], [1, 6])
+        self.assertEqual(pages[0].content, {'main': 'content/main.markdown', 'footer': 'content/footer.markdown'})
+        self.assertEqual((pages[1].path, pages[1].name, pages[1].template, pages[1].content), ('index.html', 'home', 'templates/index.html', None))
+        self.assertEqual([page.as_dict() for page in pages], manifest_to_files(self.manifest))
+
+    def test_page_as_mapping(self):
+        page = parse_manifest(self.manifest)[1]
+        self.assertEqual(page['template'], 'templates/index.html')
+        self.assertTrue('name' in page)
+        self.assertFalse('content' in page)
+        self.assertRaises(KeyError, lambda: page['content'])
+        self.assertEqual(page.get('content', {}), {})
+        self.assertEqual(repr(page), repr({'path': 'index.html', 'name': 'home', 'template': 'templates/index.html'}))
+
+    def test_errors(self):
+        try:
+            parse_manifest(self.manifest[:5] + ['\n', 'index.html:\n'])
+            self.fail()
+        except InvalidLineError as e:
+            self.assertEqual(str(e), 'Invalid line 6: expecting path, got ""')
+        self.assertRaises(InvalidLineError, parse_manifest, ['index.html:\n', '    templates/index.html\n', '    main content\n'])
+        self.assertRaises(Exception, parse_manifest, ['index.html:\n', '    templates/index.html\n', '    main: a.txt\n', '    main: b.txt\n'])
+
+    def test_load_manifest(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            manifest_path = os.path.join(tmp, 'manifest')
+            state_path = os.path.join(tmp, STATE_DIR)
+            with open(manifest_path, 'w') as f:
+                f.writelines(self.manifest)
+            pages = load_manifest(manifest_path, state_path)
+            self.assertEqual([page.as_dict() for page in pages], manifest_to_files(self.manifest))
+            self.assertTrue(os.access(os.path.join(state_path, MANIFEST_CACHE_FILE), os.F_OK))
+            self.assertEqual([page.as_dict() for page in load_manifest(manifest_path, state_path)], manifest_to_files(self.manifest))
+            with open(manifest_path, 'a') as f:
+                f.write('\nother.html:\n    templates/index.html\n')
+            self.assertEqual([page.path for page in load_manifest(manifest_path, state_path)], ['directory/file.html', 'index.html', 'other.html'])
+        finally:
+            shutil.rmtree(tmp)
+
+class GrizzCompiledTemplateTest(unittest.TestCase):
+    def setUp(self):
+        self.reads = []
+        def file_provider(path):
+            self.reads.append(path)
+            try:
+                return {'page.tpl': '<title>{title}</title>\n<a href="{@home}">home</a>\n{/nav.tpl}\n  <p>{text} and {text}</p>\nend',
+    'nav.tpl': 'nav\n{main}',
+    'missing.tpl': 'foo\n{/nosuch.tpl}\n{text}',
+    'one.txt': 'title: foo\n\nsome text',
+    'two.txt': 'two\nlines'}[path].splitlines(True)
+            except:
+                raise NoSuchFileError(path)
+        self.file_provider = file_provider
+
+        self.errors = []
+        self.error_handler = self.errors.append
+
+    def test_compile_segments(self):
+        lines = replace_template_tags(self.file_provider('page.tpl'), self.file_provider)
+        self.assertEqual(compile_segments(lines), [
+            (TEXT, 'title', '<title>', '</title>\n', 0, False, '<title>{title}</title>\n'),
+            (LITERAL, ['<a href="{@home}">home</a>\n'], True),
+            (LITERAL, ['nav\n'], False),
+            (TEXT, 'main', '', '\n', 3, False, '{main}\n'),
+            (TEXT, 'text', '  <p>', ' and {text}</p>\n', 4, True, '  <p>{text} and {text}</p>\n'),
+            (LITERAL, ['end'], False),
+        ])
+
+    def test_shared_template(self):
+        files = [
+            {'path': 'index.html', 'name': 'home', 'template': 'page.tpl', 'content': {'text': 'one.txt', 'main': 'two.txt'}},
+            {'path': 'other.html', 'template': 'page.tpl', 'content': {'text': 'two.txt', 'main': 'one.txt'}},
+        ]
+        templates = {}
+        for f in files:
+            self.assertEqual(render_file(f, files, self.file_provider, self.error_handler, templates),
+                             render_file(f, files, self.file_provider, self.error_handler))
+        self.assertEqual(sorted(templates), ['nav.tpl', 'page.tpl'])
+        self.assertEqual(set(templates['page.tpl']['paths']), set(['page.tpl', 'nav.tpl']))
+        self.assertEqual(self.reads.count('page.tpl'), 3)
+        self.assertEqual(self.reads.count('nav.tpl'), 3)
+        self.assertEqual(render_file(files[0], files, self.file_provider, self.error_handler, templates), [
+            '<title>foo</title>\n', '<a href="index.html">home</a>\n', 'nav\n', 'two\n', 'lines\n', '  <p>some text and {text}</p>\n', 'end'])
+
+    def test_shared_include(self):
+        tpls = {'page.tpl': '{/a.tpl}\n  {/b.tpl}\n', 'a.tpl': '<a>\n {/part.tpl}\n', 'b.tpl': '<b>\n{/part.tpl}\n', 'part.tpl': 'x\ny\n'}
+        reads = []
+        def file_provider(path):
+            reads.append(path)
+            return tpls[path].splitlines(True)
+        templates = {}
+        self.assertEqual(load_template('page.tpl', file_provider, templates)['lines'], ['<a>\n', ' x\n', ' y\n', '  <b>\n', '  x\n', '  y\n'])
+        self.assertEqual(reads, ['page.tpl', 'a.tpl', 'part.tpl', 'b.tpl'])
+        self.assertEqual(set(templates['b.tpl']['paths']), set(['b.tpl', 'part.tpl']))
+        self.assertEqual(set(templates['page.tpl']['paths']), set(['page.tpl', 'a.tpl', 'b.tpl', 'part.tpl']))
+
+    def test_include_cycle(self):
+        tpls = {'page.tpl': 'page\n{/a.tpl}\n{text}\n', 'a.tpl': 'a\n{/b.tpl}\n', 'b.tpl': '{/a.tpl}\n', 'self.tpl': '{/self.tpl}\n'}
+        file_provider = lambda path: tpls[path].splitlines(True)
+        try:
+            replace_template_tags(file_provider('self.tpl'), file_provider)
+            self.fail()
+        except TemplateCycleError as e:
+            self.assertEqual(e.chain, ['self.tpl', 'self.tpl'])
+        f = {'path': 'index.html', 'template': 'page.tpl', 'content': {'text': 'two.txt'}}
+        templates = {}
+        self.assertEqual(render_file(f, [f], lambda path: tpls[path].splitlines(True) if path in tpls else self.file_provider(path), self.error_handler, templates),
+                         ['page\n', '{/a.tpl}\n', 'two\n', 'lines\n'])
+        self.assertEqual(self.errors, ['error: template include cycle page.tpl -> a.tpl -> b.tpl -> a.tpl in page.tpl'])
+        self.assertEqual(sorted(templates), ['page.tpl'])
+
+    def test_missing_include(self):
+        templates = {}
+        f = {'path': 'index.html', 'template': 'missing.tpl', 'content': {'text': 'two.txt'}}
+        for i in range(2):
+            self.assertEqual(render_file(f, [f], self.file_provider, self.error_handler, templates),
+                             ['foo\n', '{/nosuch.tpl}\n', 'two\n', 'lines'])
+        self.assertEqual(self.errors, ['error: referenced template nosuch.tpl in missing.tpl not found'] * 2)
+        self.assertEqual(self.reads.count('missing.tpl'), 1)
+
+class GrizzUrlReplaceTest(unittest.TestCase):
+    def setUp(self):
+        self.files = [
+            {'path': 'index.html', 'name': 'home'},
+            {'path': 'about/', 'name': 'about'},
+            {'path': 'other.html', 'name': 'home'},
+        ]
+        self.errors = []
+        self.error_handler = self.errors.append
+
+    def test_url_index(self):
+        self.assertEqual(url_index(self.files), {'home': 'index.html', 'about': 'about/'})
+        self.assertEqual(url_index([]), {})
+
+    def test_replacement(self):
+        line = replace_url_tags('<a href="{@home}">home</a> <a href="{@about}">about</a>\n', self.files[0], url_index(self.files), self.error_handler)
+        self.assertEqual(line, '<a href="index.html">home</a> <a href="about/">about</a>\n')
+        self.assertEqual(self.errors, [])
+
+    def test_error_replacement(self):
+        line = replace_url_tags('<a href="{@nosuch}">x</a> <a href="{@home}">home</a>\n', self.files[0], url_index(self.files), self.error_handler)
+        self.assertEqual(line, '<a href="{@nosuch}">x</a> <a href="index.html">home</a>\n')
+        self.assertEqual(self.errors, ['warning: referenced URL nosuch in /index.html not found'])
+
+class GrizzCachingFileProviderTest(unittest.TestCase):
+    def setUp(self):
+        self.root_path = tempfile.mkdtemp()
+        self.file_provider = CachingFileProvider(self.root_path, max_entries=2)
+        for name in ['a.txt', 'b.txt', 'c.txt']:
+            self.write(name, name + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.root_path)
+
+    def write(self, name, text, mtime=1000000000):
+        path = os.path.join(self.root_path, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        os.utime(path, (mtime, mtime))
+
+    def test_memoized(self):
+        self.assertEqual(self.file_provider('a.txt'), ['a.txt\n'])
+        self.assertTrue(self.file_provider('a.txt') is self.file_provider('a.txt'))
+        self.assertEqual((self.file_provider.hits, self.file_provider.misses), (2, 1))
+
+    def test_changed_file(self):
+        self.file_provider('a.txt')
+        self.write('a.txt', 'changed\n', mtime=1000000001)
+        self.assertEqual(self.file_provider('a.txt'), ['changed\n'])
+        self.write('a.txt', 'longer text\n', mtime=1000000001)
+        self.assertEqual(self.file_provider('a.txt'), ['longer text\n'])
+        self.assertEqual(self.file_provider.misses, 3)
+
+    def test_bounded(self):
+        for name in ['a.txt', 'b.txt', 'a.txt', 'c.txt']:
+            self.file_provider(name)
+        self.assertEqual(list(self.file_provider.entries), ['a.txt', 'c.txt'])
+
+    def test_missing_file(self):
+        self.file_provider('a.txt')
+        os.remove(os.path.join(self.root_path, 'a.txt'))
+        self.assertRaises(NoSuchFileError, self.file_provider, 'a.txt')
+        self.assertRaises(NoSuchFileError, self.file_provider, 'nosuch.txt')
+        self.assertEqual(list(self.file_provider.entries), [])
+
+    def test_shared_lines_unmodified(self):
+        lines = self.file_provider('a.txt')
+        self.assertEqual(replace_text_tags(['<p>{text}</p>\n'], {'content': {'text': 'a.txt'}}, self.file_provider, None), ['<p>a.txt</p>\n'])
+        self.assertEqual(lines, ['a.txt\n'])
+
+class GrizzMarkdownCacheTest(unittest.TestCase):
+    def setUp(self):
+        def file_provider(path):
+            try:
+                return {'text.tpl': '<div>{text}</div>',
+    'one.markdown': 'title: one\n\n_some_ text',
+    'two.markdown': 'title: two\n\n_some_ text',
+    'other.markdown': '*other* text'}[path].splitlines(True)
+            except:
+                raise NoSuchFileError(path)
+        self.file_provider = file_provider
+
+        self.errors = []
+        self.error_handler = self.errors.append
+
+        self.markdown_cache = grizz.markdown_cache
+        grizz.markdown_cache = MarkdownCache(max_entries=2)
+
+    def tearDown(self):
+        grizz.markdown_cache = self.markdown_cache
+
+    def replace(self, filename):
+        return replace_text_tags(self.file_provider('text.tpl'), {'path': 'path', 'content': {'text': filename}}, self.file_provider, self.error_handler)
+
+    def test_shared_conversion(self):
+        self.assertEqual(self.replace('one.markdown'), ['<div><p><em>some</em> text</p></div>'])
+        self.assertEqual(self.replace('two.markdown'), ['<div><p><em>some</em> text</p></div>'])
+        self.assertEqual(self.replace('other.markdown'), ['<div><p><em>other</em> text</p></div>'])
+        self.assertEqual((grizz.markdown_cache.hits, grizz.markdown_cache.misses), (1, 2))
+
+    def test_extensions_in_key(self):
+        cache = grizz.markdown_cache
+        self.assertTrue(cache.convert('some text') is cache.convert('some text', []))
+        self.assertFalse(cache.convert('some text') is cache.convert('some text', ['def_list']))
+
+    def test_bounded(self):
+        cache = grizz.markdown_cache
+        for text in ['a', 'b', 'a', 'c']:
+            cache.convert(text)
+        self.assertEqual([key[0] for key in cache.entries], [hashlib.sha1(text.encode('utf-8')).hexdigest() for text in ['a', 'c']])
+
+    def test_reused_converter(self):
+        md = grizz.markdown.getMarkdown(['abbr'])
+        self.assertEqual(md.convert('[x][1] HTML\n\n[1]: /url\n*[HTML]: markup'), '<p><a href="/url">x</a> <abbr title="markup">HTML</abbr></p>')
+        self.assertTrue(grizz.markdown.getMarkdown(['abbr']) is md)
+        self.assertEqual(md.convert('[x][1] HTML'), '<p>[x][1] HTML</p>')
+        self.assertFalse(grizz.markdown.getMarkdown([]) is md)
+        self.assertFalse(grizz.markdown.getMarkdown(['abbr'], output_format='html4') is md)
+        other = []
+        thread = threading.Thread(target=lambda: other.append(grizz.markdown.getMarkdown(['abbr'])))
+        thread.start()
+        thread.join()
+        self.assertFalse(other[0] is md)
+
+    def test_unhashable_extension(self):
+        class Unhashable(grizz.markdown.Extension):
+            __hash__ = None
+            def extendMarkdown(self, md, md_globals):
+                del md.inlinePatterns['emphasis']
+        ext = Unhashable()
+        md = grizz.markdown.getMarkdown([ext])
+        self.assertEqual(md.convert('*some* text'), '<p>*some* text</p>')
+        self.assertFalse(grizz.markdown.getMarkdown([ext]) is md)
+        self.assertEqual(grizz.markdown.markdown('*some* text', [ext]), '<p>*some* text</p>')
+
+class GrizzMarkdownInlineTest(unittest.TestCase):
+    def convert(self, text, extensions=[]):
+        md = grizz.markdown.Markdown(extensions=extensions)
+        return md, md.convert(text)
+
+    def test_inline_patterns(self):
+        text = '*a `b* c`* **[x](/u "t")** _d_ &amp; <b>e</b> \\*f\\* <http://g.org/>  \nh ![i](/j.png) [k][] ***l***\n\n[k]: /k'
+        md, html = self.convert(text)
+        self.assertEqual(html, '<p><em>a <code>b* c</code></em> <strong><a href="/u" title="t">x</a></strong> <em>d</em> &amp; <b>e</b> *f* '
+                               '<a href="http://g.org/">http://g.org/</a><br />\nh <img src="/j.png" alt="i" /> <a href="/k">k</a> '
+                               '<strong><em>l</em></strong></p>')
+
+    def test_skipped_patterns(self):
+        md = grizz.markdown.Markdown()
+        tried = []
+        class Counted(object):
+            def __init__(self, name, regexp):
+                self.name, self.regexp = name, regexp
+            def search(self, *args):
+                tried.append(self.name)
+                return self.regexp.search(*args)
+        for name, pattern in md.inlinePatterns.items():
+            pattern.positional_re = Counted(name, pattern.positional_re)
+        self.assertEqual(md.convert('plain text, with *emphasis*'), '<p>plain text, with <em>emphasis</em></p>')
+        self.assertEqual(sorted(set(tried)), ['emphasis', 'linebreak', 'linebreak2', 'not_strong', 'strong', 'strong_em'])
+
+    def test_earlier_match(self):
+        # replacing ``b`` lets the first backtick match up to it
+        md, html = self.convert('x `a\\```b`` y')
+        self.assertEqual(html, '<p>x <code>a\\</code><code>b</code> y</p>')
+
+    def test_trailing_newline(self):
+        md = grizz.markdown.Markdown()
+        processor = md.treeprocessors['inline']
+        root = grizz.markdown.etree.Element('div')
+        p = grizz.markdown.etree.SubElement(root, 'p')
+        p.text = '*a* b  \n\n'
+        processor.run(root)
+        self.assertEqual(grizz.markdown.etree.tostring(root, encoding='unicode'), '<div><p><em>a</em> b<br /></p></div>')
+
+    def test_compiled_pattern(self):
+        md = grizz.markdown.Markdown()
+        for pattern in md.inlinePatterns.values():
+            pattern.positional_re = None
+        md2, html = self.convert('x `a\\```b`` y *c* [d](/e)')
+        self.assertEqual(md.convert('x `a\\```b`` y *c* [d](/e)'), html)
+
+    def test_unknown_triggers(self):
+        md, html = self.convert('ABC and [[Page]]\n\n*[ABC]: alpha', ['abbr', 'wikilinks'])
+        self.assertEqual(html, '<p><abbr title="alpha">ABC</abbr> and <a href="/Page/" class="wikilink">Page</a></p>')
+
+class GrizzMarkdownBlockTest(unittest.TestCase):
+    def names(self, parser, block):
+        by_processor = dict((id(processor), name) for name, processor in parser.blockprocessors.items())
+        return [by_processor[id(processor)] for processor in parser.processorsFor(block)]
+
+    def test_dispatch(self):
+        parser = grizz.markdown.Markdown().parser
+        self.assertEqual(self.names(parser, 'some text'), ['hashheader', 'setextheader', 'hr', 'quote', 'paragraph'])
+        self.assertEqual(self.names(parser, '  12. item'), ['hashheader', 'setextheader', 'hr', 'olist', 'quote', 'paragraph'])
+        self.assertEqual(self.names(parser, '* item'), ['hashheader', 'setextheader', 'hr', 'ulist', 'quote', 'paragraph'])
+        self.assertEqual(self.names(parser, '    code'), ['indent', 'code', 'hashheader', 'setextheader', 'hr', 'quote', 'paragraph'])
+        self.assertEqual(self.names(parser, ' \nafter'), ['empty', 'hashheader', 'setextheader', 'hr', 'quote', 'paragraph'])
+        self.assertTrue(parser.processorsFor('some other text') is parser.processorsFor('some text'))
+
+    def test_unicode_hints(self):
+        self.assertEqual(grizz.markdown.markdown('\u0661. one\n\u0662. two'), '<ol>\n<li>one</li>\n<li>two</li>\n</ol>')
+        self.assertEqual(grizz.markdown.markdown('\uff11. one\n\uff12. two'), '<ol>\n<li>one</li>\n<li>two</li>\n</ol>')
+        self.assertEqual(grizz.markdown.markdown('\u3000\ntext'), '<p>text</p>')
+
+    def test_registry_changed(self):
+        md = grizz.markdown.Markdown()
+        parser = md.parser
+        self.assertEqual(md.convert('text\n\n!! shout'), '<p>text</p>\n<p>!! shout</p>')
+        class ShoutProcessor(grizz.markdown.blockprocessors.BlockProcessor):
+            FIRST = '!'
+            def test(self, parent, block):
+                return block.startswith('!!')
+            def run(self, parent, blocks):
+                grizz.markdown.etree.SubElement(parent, 'h1').text = blocks.pop(0)[2:].strip()
+        parser.blockprocessors.add('shout', ShoutProcessor(parser), '<paragraph')
+        self.assertEqual(self.names(parser, 'text')[-1], 'paragraph')
+        self.assertEqual(md.convert('text\n\n!! shout'), '<p>text</p>\n<h1>shout</h1>')
+        del parser.blockprocessors['shout']
+        self.assertEqual(md.convert('text\n\n!! shout'), '<p>text</p>\n<p>!! shout</p>')
+
+    def test_block_queue(self):
+        blocks = grizz.markdown.blockparser.BlockQueue(['a', 'b', 'c', 'd'])
+        self.assertEqual(blocks.pop(0), 'a')
+        blocks.insert(0, 'x')
+        self.assertEqual(blocks[1:3], ['b', 'c'])
+        self.assertEqual(blocks.pop(), 'd')
+        self.assertEqual(blocks.pop(1), 'b')
+        blocks[1:] = ['y', 'z']
+        del blocks[:1]
+        self.assertEqual(list(blocks), ['y', 'z'])
+
+    def test_list_processor(self):
+        md = grizz.markdown.Markdown()
+        parser = md.parser
+        class PairProcessor(grizz.markdown.blockprocessors.BlockProcessor):
+            # written for a list of blocks
+            def test(self, parent, block):
+                return block == 'pair'
+            def run(self, parent, blocks):
+                blocks.pop(0)
+                first, second = blocks[:2]
+                del blocks[:2]
+                grizz.markdown.etree.SubElement(parent, 'pre').text = '%s+%s' % (first, second)
+                blocks.insert(0, 'after')
+        parser.blockprocessors.add('pair', PairProcessor(parser), '_begin')
+        self.assertEqual(md.convert('pair\n\none\n\ntwo\n\nrest'), '<pre>one+two</pre>\n<p>after</p>\n<p>rest</p>')
+        blocks = ['some', 'text']
+        root = grizz.markdown.etree.Element('div')
+        parser.parseBlocks(root, blocks)
+        self.assertEqual((len(root), blocks), (2, []))
+
+class GrizzSiteTestCase(unittest.TestCase):
+    """renders a scratch copy of the test site"""
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root_path = os.path.join(self.tmp, 'site')
+        shutil.copytree('./test', self.root_path, ignore=shutil.ignore_patterns('out', STATE_DIR))
+        self.manifest = os.path.join(self.root_path, 'manifest')
+        self.out_path = os.path.join(self.root_path, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def render(self, **kwargs):
+        """renders the site, returning the set of output paths that were written"""
+        for dirpath, dirnames, filenames in os.walk(self.out_path):
+            for name in filenames:
+                os.utime(os.path.join(dirpath, name), (0, 0))
+        self.output = io.StringIO()
+        stdout, sys.stdout = sys.stdout, self.output
+        try:
+            self.assertTrue(render_from_manifest(self.manifest, **kwargs))
+        finally:
+            sys.stdout = stdout
+        written = set()
+        for dirpath, dirnames, filenames in os.walk(self.out_path):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if os.stat(path).st_mtime != 0:
+                    written.add(os.path.relpath(path, self.out_path))
+        return written
+
+    def write(self, path, text):
+        with open(os.path.join(self.root_path, path), 'a') as f:
+            f.write(text)
+
+class GrizzTargetedRebuildTest(GrizzSiteTestCase):
+    def test_changed_content(self):
+        self.render()
+        self.write('multiline.txt', 'five\n')
+        self.write('templates/html.inc', '<b>TEXT TWO</b>\n')
+        self.assertEqual(self.render(changed=['multiline.txt']), set(['multiline.html', 'inc4.html']))
+
+    def test_changed_directory(self):
+        self.render()
+        self.write('templates/html.inc', '<b>TEXT TWO</b>\n')
+        self.assertEqual(self.render(changed=['templates']), set(['directory/inc1.html', 'inc2.html', 'inc3.html', 'inc4.html', 'url1.html', 'url2.html']))
+
+    def test_changed_manifest(self):
+        self.render()
+        self.write('manifest', 'more.html:\n    templates/index.html\n')
+        self.assertEqual(self.render(changed=['manifest', 'other.txt']), set(['more.html']))
+
+    def test_unrelated_change(self):
+        self.render()
+        self.assertEqual(self.render(changed=['in/style.css']), set())
+
+    def test_is_ignored_change(self):
+        root = self.root_path
+        for path in ['out/index.html', STATE_DIR + '/deps.json', 'templates/.foo.html.swp', 'multiline.txt~', '.#manifest', '4913']:
+            self.assertTrue(is_ignored_change(root, os.path.join(root, path)), path)
+        for path in ['manifest', 'templates/foo.html', 'outline.txt', 'in/out/image.png']:
+            self.assertFalse(is_ignored_change(root, os.path.join(root, path)), path)
+
+    def test_changed_paths(self):
+        root = self.root_path
+        path = lambda relpath: os.path.join(root, relpath)
+        self.assertEqual(changed_paths(root, 'modified', False, path('multiline.txt')), ['multiline.txt'])
+        self.assertEqual(changed_paths(root, 'moved', False, path('a.txt'), path('templates/b.html')), ['a.txt', 'templates/b.html'])
+        self.assertEqual(changed_paths(root, 'created', True, path('templates/new')), ['templates/new'])
+        self.assertEqual(changed_paths(root, 'opened', False, path('templates/foo.html')), [])
+        self.assertEqual(changed_paths(root, 'modified', False, path('out/index.html')), [])
+
+    def test_swap_file(self):
+        self.render()
+        root = self.root_path
+        with open(os.path.join(root, 'templates/.foo.html.swp'), 'w') as f:
+            f.write('swap')
+        changed = changed_paths(root, 'created', False, os.path.join(root, 'templates/.foo.html.swp'))
+        changed += changed_paths(root, 'modified', True, os.path.join(root, 'templates'))
+        self.assertEqual(changed, [])
+        self.assertEqual(self.render(changed=changed), set())
+
+class GrizzDebouncerTest(unittest.TestCase):
+    def test_burst(self):
+        calls = []
+        debouncer = Debouncer(calls.append, delay=0.05)
+        for item in ['a', 'b', 'a', 'c']:
+            debouncer.add(item)
+        time.sleep(0.2)
+        self.assertEqual(calls, [set(['a', 'b', 'c'])])
+        debouncer.add('d')
+        time.sleep(0.2)
+        self.assertEqual(calls, [set(['a', 'b', 'c']), set(['d'])])
+
+class GrizzStreamingTest(GrizzSiteTestCase):
+    def test_iter_render_file(self):
+        file_provider = CachingFileProvider(self.root_path)
+        with open(self.manifest) as f:
+            files = manifest_to_files(f)
+        for f in files:
+            chunks = iter_render_file(f, files, file_provider, None)
+            self.assertEqual(next(chunks), '<html>\n')
+            self.assertEqual(['<html>\n'] + list(chunks), render_file(f, files, file_provider, None))
+
+    def test_failed_page_not_written(self):
+        self.render()
+        with open(os.path.join(self.out_path, 'url1.html')) as f:
+            before = f.read()
+        os.remove(os.path.join(self.root_path, 'link.txt'))
+        self.output = io.StringIO()
+        stdout, sys.stdout = sys.stdout, self.output
+        try:
+            self.assertFalse(render_from_manifest(self.manifest))
+        finally:
+            sys.stdout = stdout
+        with open(os.path.join(self.out_path, 'url1.html')) as f:
+            self.assertEqual(f.read(), before)
+        self.assertEqual([name for name in os.listdir(self.out_path) if name.endswith('.tmp')], [])
+
+class GrizzIncrementalTest(GrizzSiteTestCase):
+    def test_first_build(self):
+        written = self.render()
+        self.assertEqual(len(written), 11)
+        for path in written:
+            with open(os.path.join(self.out_path, path)) as out, open(os.path.join('./test/cmp', path)) as cmp:
+                self.assertEqual(out.read(), cmp.read())
+
+    def test_nothing_changed(self):
+        self.render()
+        self.assertEqual(self.render(), set())
+
+    def test_content_changed(self):
+        self.render()
+        self.write('multiline.txt', 'five\n')
+        self.assertEqual(self.render(), set(['multiline.html', 'inc4.html']))
+
+    def test_include_changed(self):
+        self.render()
+        self.write('templates/html.inc', '<b>TEXT TWO</b>\n')
+        self.assertEqual(self.render(), set(['directory/inc1.html', 'inc2.html', 'inc3.html', 'inc4.html', 'url1.html', 'url2.html']))
+
+    def test_manifest_entry_changed(self):
+        self.render()
+        self.write('manifest', 'more.html:\n    templates/index.html\n')
+        self.assertEqual(self.render(), set(['more.html']))
+
+    def test_names_changed(self):
+        self.render()
+        with open(self.manifest) as f:
+            manifest = f.read()
+        with open(self.manifest, 'w') as f:
+            f.write(manifest.replace('(inc1)', '(inc-one)'))
+        self.assertEqual(self.render(), set(['url1.html', 'url2.html', 'url3.html']))
+
+    def test_missing_output(self):
+        self.render()
+        os.remove(os.path.join(self.out_path, 'oneline.html'))
+        self.assertEqual(self.render(), set(['oneline.html']))
+
+    def test_force(self):
+        self.render()
+        self.write('multiline.txt', 'five\n')
+        self.assertEqual(self.render(force=True), set(['multiline.html', 'inc4.html']))
+        self.assertTrue('2 pages written, 9 unchanged' in self.output.getvalue())
+
+    def test_changed_while_rendering(self):
+        test = self
+        class SavingProvider(CachingFileProvider):
+            def read_signed(self, path):
+                result = CachingFileProvider.read_signed(self, path)
+                if path == 'multiline.txt' and not saved:
+                    saved.append(path)
+                    test.write('multiline.txt', 'five\n')
+                return result
+        saved = []
+        self.render(cache=False, file_provider=SavingProvider(self.root_path))
+        with open(os.path.join(self.out_path, 'multiline.html')) as f:
+            self.assertFalse('five' in f.read())
+        self.assertEqual(self.render(cache=False), set(['multiline.html']))
+
+    def test_now_changed(self):
+        self.write('templates/now.html', '<link href="s.css?{_now}">\n')
+        self.write('manifest', 'now.html:\n    templates/now.html\n')
+        self.render()
+        now_time = grizz.NOW_TIME
+        try:
+            grizz.NOW_TIME += 1
+            self.assertEqual(self.render(), set(['now.html']))
+            grizz.NOW_TIME += 1
+            self.assertEqual(self.render(changed=['multiline.txt']), set(['now.html']))
+        finally:
+            grizz.NOW_TIME = now_time
+        with open(os.path.join(self.out_path, 'now.html')) as f:
+            self.assertEqual(f.read(), '<link href="s.css?%d">\n' % (now_time + 2))
+
+class GrizzUnchangedOutputTest(GrizzSiteTestCase):
+    def test_unchanged_not_written(self):
+        self.assertEqual(len(self.render()), 11)
+        self.assertTrue('11 pages written, 0 unchanged' in self.output.getvalue())
+        self.assertEqual(self.render(force=True), set())
+        self.assertTrue('0 pages written, 11 unchanged' in self.output.getvalue())
+
+    def test_changed_output_written(self):
+        self.render()
+        with open(os.path.join(self.out_path, 'oneline.html'), 'a') as f:
+            f.write('edited\n')
+        self.assertEqual(self.render(force=True), set(['oneline.html']))
+        with open(os.path.join(self.out_path, 'oneline.html')) as out, open('./test/cmp/oneline.html') as cmp:
+            self.assertEqual(out.read(), cmp.read())
+
+    def test_same_contents(self):
+        self.render()
+        self.assertTrue(same_contents(os.path.join(self.out_path, 'url1.html'), './test/cmp/url1.html'))
+        self.assertFalse(same_contents(os.path.join(self.out_path, 'url1.html'), './test/cmp/url2.html'))
+        self.assertFalse(same_contents(os.path.join(self.out_path, 'url1.html'), './test/cmp/nosuch.html'))
+
+class GrizzBuildCacheTest(GrizzSiteTestCase):
+    def setUp(self):
+        GrizzSiteTestCase.setUp(self)
+        self.rendered = []
+        self.iter_render_file = grizz.iter_render_file
+        def counting_iter_render_file(f, *args):
+            self.rendered.append(f['path'])
+            return self.iter_render_file(f, *args)
+        grizz.iter_render_file = counting_iter_render_file
+
+    def tearDown(self):
+        grizz.iter_render_file = self.iter_render_file
+        GrizzSiteTestCase.tearDown(self)
+
+    def forget_deps(self):
+        os.remove(os.path.join(self.root_path, STATE_DIR, DEPS_FILE))
+
+    def test_cold_build_from_cache(self):
+        self.render()
+        self.forget_deps()
+        self.rendered = []
+        shutil.rmtree(self.out_path)
+        self.assertEqual(len(self.render()), 11)
+        self.assertEqual(self.rendered, [])
+        for path in ['index.html', 'inc4.html', 'markdown.html', 'url2.html']:
+            with open(os.path.join(self.out_path, path)) as out, open(os.path.join('./test/cmp', path)) as cmp:
+                self.assertEqual(out.read(), cmp.read())
+
+    def test_content_changed(self):
+        self.render()
+        self.forget_deps()
+        self.write('multiline.txt', 'five\n')
+        self.rendered = []
+        self.render()
+        self.assertEqual(sorted(self.rendered), ['inc4.html', 'multiline.html'])
+
+    def test_no_cache(self):
+        self.render()
+        self.forget_deps()
+        self.rendered = []
+        self.render(cache=False)
+        self.assertEqual(len(self.rendered), 11)
+
+    def cache_entries(self):
+        cache_path = os.path.join(self.root_path, STATE_DIR, CACHE_DIR)
+        return sorted(name for dirname in os.listdir(cache_path) for name in os.listdir(os.path.join(cache_path, dirname)))
+
+    def test_prune(self):
+        self.render()
+        state_path = os.path.join(self.root_path, STATE_DIR)
+        entries = self.cache_entries()
+        self.assertEqual(len(entries), 22)
+        self.assertEqual(prune_cache(state_path), 0)
+        paths = [os.path.join(state_path, CACHE_DIR, name[:2], name) for name in entries if not name.endswith('.errors')]
+        total = sum(os.stat(path).st_size + os.stat(path + '.errors').st_size for path in paths)
+        os.utime(paths[3], (0, 0))
+        self.assertEqual(prune_cache(state_path, total - 1), 1)
+        self.assertEqual(self.cache_entries(), [name for name in entries if not name.startswith(os.path.basename(paths[3]))])
+        self.assertEqual(prune_cache(state_path, 0), 10)
+        self.assertEqual(self.cache_entries(), [])
+
+    def test_pruned_after_build(self):
+        self.render()
+        max_bytes = grizz.CACHE_MAX_BYTES
+        try:
+            grizz.CACHE_MAX_BYTES = 0
+            self.render()
+            self.assertEqual(len(self.cache_entries()), 22)
+            self.write('multiline.txt', 'five\n')
+            self.render()
+            self.assertEqual(self.cache_entries(), [])
+        finally:
+            grizz.CACHE_MAX_BYTES = max_bytes
+
+    def test_missing_content_not_cached(self):
+        os.remove(os.path.join(self.root_path, 'link.txt'))
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                self.assertFalse(render_from_manifest(self.manifest))
+            finally:
+                sys.stdout = stdout
+
+class GrizzParallelTest(GrizzSiteTestCase):
+    def test_parallel_build(self):
+        self.write('manifest', 'broken1.html:\n    templates/broken.html\n    main: link.txt\n\n')
+        self.write('manifest', 'broken2.html:\n    templates/broken.html\n    main: multiline.txt\n    other: link.txt\n')
+        self.write('templates/broken.html', '{main}\n<a href="{@nosuch}">{other}</a>\n')
+        written = self.render(jobs=4, cache=False)
+        self.assertEqual(len(written), 13)
+        parallel_output = self.output.getvalue()
+        for path in ['index.html', 'inc4.html', 'markdown.html', 'url2.html']:
+            with open(os.path.join(self.out_path, path)) as out, open(os.path.join('./test/cmp', path)) as cmp:
+                self.assertEqual(out.read(), cmp.read())
+        self.render(force=True, cache=False)
+        self.assertEqual(parallel_output.splitlines()[:-1], self.output.getvalue().splitlines()[:-1])
+        self.assertTrue(parallel_output.index('/broken1.html') < parallel_output.index('/broken2.html'))
+
+    def test_parallel_failure(self):
+        os.remove(os.path.join(self.root_path, 'link.txt'))
+        self.output = io.StringIO()
+        stdout, sys.stdout = sys.stdout, self.output
+        try:
+            self.assertFalse(render_from_manifest(self.manifest, jobs=4))
+        finally:
+            sys.stdout = stdout
+        self.assertTrue('link.txt' in self.output.getvalue())
+        self.assertTrue(os.access(os.path.join(self.out_path, 'inc4.html'), os.F_OK))
+        self.assertFalse(os.access(os.path.join(self.out_path, 'url1.html'), os.F_OK))
+
+class GrizzPageStoreTest(GrizzSiteTestCase):
+    def setUp(self):
+        GrizzSiteTestCase.setUp(self)
+        self.store = PageStore()
+
+    def test_render(self):
+        self.assertEqual(self.render(page_store=self.store), set())
+        self.assertTrue(self.output.getvalue().endswith('11 pages written, 0 unchanged\n'))
+        for path in ['index.html', 'directory/inc1.html', 'markdown.html', 'url2.html']:
+            with open(os.path.join('./test/cmp', path), 'rb') as cmp:
+                self.assertEqual(self.store.get(path).body, cmp.read())
+        self.assertFalse(os.access(os.path.join(self.root_path, STATE_DIR, DEPS_FILE), os.F_OK))
+
+    def test_rebuild(self):
+        self.render(page_store=self.store)
+        pages = dict(self.store.pages)
+        self.write('multiline.txt', 'five\n')
+        self.render(page_store=self.store, changed=['multiline.txt'])
+        self.assertTrue(self.output.getvalue().endswith('2 pages written, 9 unchanged\n'))
+        self.assertFalse(pages is self.store.pages)
+        changed = set(path for path in pages if pages[path] is not self.store.get(path))
+        self.assertEqual(changed, set(['multiline.html', 'inc4.html']))
+        self.assertNotEqual(self.store.get('inc4.html').etag, pages['inc4.html'].etag)
+
+    def test_written_handler(self):
+        written = []
+        self.render(page_store=self.store)
+        self.write('multiline.txt', 'five\n')
+        self.render(page_store=self.store, force=True, written_handler=written.append)
+        self.assertEqual(written, ['multiline.html', 'inc4.html'])
+
+    def test_removed_page(self):
+        self.render(page_store=self.store)
+        with open(self.manifest) as f:
+            manifest = f.read()
+        with open(self.manifest, 'w') as f:
+            f.write(manifest.replace('url3.html:', 'url4.html:'))
+        self.render(page_store=self.store, changed=['manifest'])
+        self.assertEqual(self.store.get('url3.html'), None)
+        self.assertNotEqual(self.store.get('url4.html'), None)
+
+    def test_failed_build(self):
+        self.render(page_store=self.store)
+        pages, deps = self.store.pages, self.store.deps
+        self.write('multiline.txt', 'five\n')
+        os.remove(os.path.join(self.root_path, 'link.txt'))
+        stdout, sys.stdout = sys.stdout, io.StringIO()
+        try:
+            self.assertFalse(render_from_manifest(self.manifest, page_store=self.store, force=True))
+        finally:
+            sys.stdout = stdout
+        self.assertTrue(self.store.pages is pages)
+        self.assertTrue(self.store.deps is deps)
+
+    def test_build_error(self):
+        self.render(page_store=self.store)
+        pages = self.store.pages
+        self.write('multiline.txt', 'five\n')
+        def written_handler(path):
+            if path == 'inc4.html':
+                raise RuntimeError(path)
+        stdout, sys.stdout = sys.stdout, io.StringIO()
+        try:
+            self.assertRaises(RuntimeError, render_from_manifest, self.manifest, page_store=self.store, force=True, written_handler=written_handler)
+        finally:
+            sys.stdout = stdout
+        self.assertTrue(self.store.pages is pages)
+
+class GrizzReloadNotifierTest(unittest.TestCase):
+    def test_wait(self):
+        notifier = ReloadNotifier(history=2)
+        self.assertEqual(notifier.wait(0, 0), (0, []))
+        notifier.notify(['a.html'])
+        notifier.notify([])
+        notifier.notify(['b.html', 'a.html'])
+        self.assertEqual(notifier.wait(0, 0), (2, ['a.html', 'b.html']))
+        self.assertEqual(notifier.wait(1, 0), (2, ['b.html', 'a.html']))
+        notifier.notify(['c.css'])
+        self.assertEqual(notifier.wait(0, 0), (3, ['*']))
+        notifier.close()
+        self.assertEqual(notifier.wait(3), (3, None))
+
+    def test_inject(self):
+        self.assertEqual(inject_reload_script(b'<body>x</BODY></html>'), b'<body>x' + RELOAD_SCRIPT + b'</BODY></html>')
+        self.assertEqual(inject_reload_script(b'x'), b'x' + RELOAD_SCRIPT)
+
+class GrizzBuildStatsTest(GrizzSiteTestCase):
+    def test_stats(self):
+        stats = BuildStats()
+        self.render(stats=stats)
+        self.assertEqual((stats.checked, len(stats.pages), stats.written), (11, 11, 11))
+        self.assertEqual(stats.caches['build'], {'hits': 0, 'misses': 11})
+        self.assertEqual(stats.caches['markdown']['hits'] + stats.caches['markdown']['misses'], 1)
+        page = stats.pages['markdown.html']
+        self.assertEqual(page['template'], 'templates/foo.html')
+        for phase in ['template', 'info', 'text', 'markdown', 'write']:
+            self.assertTrue(page['phases'][phase] > 0, phase)
+        self.assertTrue(stats.pages['url1.html']['phases']['urls'] > 0)
+        self.assertTrue(sum(page['phases'].values()) <= page['total'])
+        self.assertTrue(sum(page['total'] for page in stats.pages.values()) <= stats.total)
+        self.assertEqual(stats.templates()['templates/foo.html']['pages'], 4)
+        summary = stats.summary(limit=2)
+        self.assertTrue(summary.splitlines()[0].endswith('total: 11 pages checked, 11 rendered, 11 written'))
+
+        path = os.path.join(self.tmp, 'stats.json')
+        stats.save(path)
+        with open(path) as f:
+            saved = json.load(f)
+        self.assertEqual(saved['rendered'], 11)
+        self.assertEqual(saved['pages']['markdown.html']['phases'], page['phases'])
+
+    def test_cached_and_parallel(self):
+        self.render()
+        stats = BuildStats()
+        self.render(stats=stats, force=True, jobs=2)
+        self.assertEqual(stats.caches['build'], {'hits': 11, 'misses': 0})
+        self.assertTrue(all(page['cached'] for page in stats.pages.values()))
+        self.assertTrue(stats.pages['index.html']['phases']['cache'] > 0)
+
+class GrizzCompressTest(GrizzSiteTestCase):
+    def test_render(self):
+        written = self.render(compress=True)
+        self.assertTrue('index.html.gz' in written)
+        with open(os.path.join(self.out_path, 'index.html'), 'rb') as f, gzip.open(os.path.join(self.out_path, 'index.html.gz')) as gz:
+            self.assertEqual(f.read(), gz.read())
+        self.write('multiline.txt', 'five\n')
+        self.assertEqual(self.render(compress=True), set(['multiline.html', 'multiline.html.gz', 'inc4.html', 'inc4.html.gz']))
+        os.remove(os.path.join(self.out_path, 'url1.html.gz'))
+        self.render(compress=True)
+        self.assertTrue(os.access(os.path.join(self.out_path, 'url1.html.gz'), os.F_OK))
+
+    def test_compress_file(self):
+        path = os.path.join(self.root_path, 'image.png')
+        with open(path, 'wb') as f:
+            f.write(b'png')
+        self.assertEqual(compress_file(path), [])
+        path = os.path.join(self.root_path, 'oneline.txt')
+        self.assertEqual(compress_file(path, ['gzip']), [path + '.gz'])
+        self.assertEqual(os.stat(path).st_mtime_ns, os.stat(path + '.gz').st_mtime_ns)
+        self.assertEqual(compress_file(path, ['gzip']), [])
+        remove_compressed(path)
+        self.assertFalse(os.access(path + '.gz', os.F_OK))
+
+class GrizzAssetSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.in_path = os.path.join(self.tmp, 'in')
+        self.out_path = os.path.join(self.tmp, 'out')
+        self.state_path = os.path.join(self.tmp, STATE_DIR)
+        os.makedirs(os.path.join(self.in_path, 'css'))
+        self.write('style.txt', 'a')
+        self.write('css/site.css', 'body {}')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, path, text):
+        with open(os.path.join(self.in_path, path), 'w') as f:
+            f.write(text)
+
+    def read(self, path):
+        with open(os.path.join(self.out_path, path)) as f:
+            return f.read()
+
+    def sync(self, **kwargs):
+        return sync_assets(self.in_path, self.out_path, self.state_path, **kwargs)
+
+    def test_sync(self):
+        self.assertEqual(self.sync(), (['style.txt', 'css/site.css'], [], []))
+        self.assertEqual(self.read('css/site.css'), 'body {}')
+        self.assertEqual(self.sync(), ([], ['style.txt', 'css/site.css'], []))
+        self.write('style.txt', 'b')
+        self.assertEqual(self.sync(), (['style.txt'], ['css/site.css'], []))
+        self.assertEqual(self.read('style.txt'), 'b')
+
+    def test_remove_stale(self):
+        self.sync()
+        with open(os.path.join(self.out_path, 'page.html'), 'w') as f:
+            f.write('rendered')
+        os.remove(os.path.join(self.in_path, 'css/site.css'))
+        self.assertEqual(self.sync(), ([], ['style.txt'], ['css/site.css']))
+        self.assertFalse(os.access(os.path.join(self.out_path, 'css/site.css'), os.F_OK))
+        self.assertEqual(self.read('page.html'), 'rendered')
+
+    def test_keep_replaced(self):
+        self.sync()
+        os.remove(os.path.join(self.in_path, 'style.txt'))
+        tmp_path = os.path.join(self.out_path, 'style.txt.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write('rendered')
+        os.replace(tmp_path, os.path.join(self.out_path, 'style.txt'))
+        self.assertEqual(self.sync(), ([], ['css/site.css'], []))
+        self.assertEqual(self.read('style.txt'), 'rendered')
+        self.assertEqual(self.sync(), ([], ['css/site.css'], []))
+        self.assertEqual(self.read('style.txt'), 'rendered')
+
+    def test_linked_directory(self):
+        shared = os.path.join(self.tmp, 'shared')
+        os.makedirs(shared)
+        with open(os.path.join(shared, 'b.txt'), 'w') as f:
+            f.write('b')
+        os.symlink('../shared', os.path.join(self.in_path, 'linked'))
+        os.symlink('..', os.path.join(self.in_path, 'css', 'up'))
+        self.assertEqual(self.sync(), (['style.txt', 'css/site.css', 'linked/b.txt'], [], []))
+        self.assertEqual(self.read('linked/b.txt'), 'b')
+        self.assertFalse(os.path.islink(os.path.join(self.out_path, 'linked')))
+
+    def test_checksum(self):
+        self.sync()
+        os.utime(os.path.join(self.in_path, 'style.txt'), (0, 0))
+        self.assertEqual(self.sync(checksum=True), ([], ['style.txt', 'css/site.css'], []))
+        self.assertEqual(self.sync(), (['style.txt'], ['css/site.css'], []))
+
+    def test_compress(self):
+        self.sync(compress=True)
+        self.assertTrue(os.access(os.path.join(self.out_path, 'css/site.css.gz'), os.F_OK))
+        os.remove(os.path.join(self.in_path, 'css/site.css'))
+        self.sync(compress=True)
+        self.assertFalse(os.access(os.path.join(self.out_path, 'css/site.css.gz'), os.F_OK))
+
+    def test_link(self):
+        self.sync(link='hardlink')
+        self.assertTrue(os.path.samefile(os.path.join(self.in_path, 'style.txt'), os.path.join(self.out_path, 'style.txt')))
+        shutil.rmtree(self.out_path)
+        self.sync(link='reflink')
+        self.assertEqual(self.read('style.txt'), 'a')
+        self.assertEqual(self.sync(link='reflink'), ([], ['style.txt', 'css/site.css'], []))
+
+class GrizzServerTest(unittest.TestCase):
+    def setUp(self):
+        self.out_path = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.out_path, 'dir'))
+        with open(os.path.join(self.out_path, 'page.html'), 'w') as f:
+            f.write('<p>page</p>')
+        with open(os.path.join(self.out_path, 'dir', 'index.html'), 'w') as f:
+            f.write('<p>index</p>')
+        self.log_message, PreviewRequestHandler.log_message = PreviewRequestHandler.log_message, lambda *args: None
+        self.server = make_server(self.out_path, 0)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.conn = http.client.HTTPConnection('localhost', self.server.server_address[1])
+
+    def tearDown(self):
+        self.conn.close()
+        if self.server.reload_notifier:
+            self.server.reload_notifier.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        PreviewRequestHandler.log_message = self.log_message
+        shutil.rmtree(self.out_path)
+
+    def get(self, path, headers={}):
+        self.conn.request('GET', path, headers=headers)
+        response = self.conn.getresponse()
+        return response, response.read()
+
+    def test_get(self):
+        response, body = self.get('/page.html')
+        self.assertEqual((response.status, body), (200, b'<p>page</p>'))
+        self.assertEqual(response.getheader('Content-Type'), 'text/html')
+        # same connection
+        response, body = self.get('/dir/')
+        self.assertEqual((response.status, body), (200, b'<p>index</p>'))
+        response, body = self.get('/dir')
+        self.assertEqual(response.status, 301)
+        response, body = self.get('/nosuch.html')
+        self.assertEqual(response.status, 404)
+
+    def test_conditional_get(self):
+        response, body = self.get('/page.html')
+        etag = response.getheader('ETag')
+        last_modified = response.getheader('Last-Modified')
+        response, body = self.get('/page.html', {'If-None-Match': etag})
+        self.assertEqual((response.status, body), (304, b''))
+        response, body = self.get('/page.html', {'If-Modified-Since': last_modified})
+        self.assertEqual(response.status, 304)
+        response, body = self.get('/page.html', {'If-None-Match': '"other"', 'If-Modified-Since': last_modified})
+        self.assertEqual(response.status, 200)
+
+        with open(os.path.join(self.out_path, 'page.html'), 'w') as f:
+            f.write('<p>changed</p>')
+        response, body = self.get('/page.html', {'If-None-Match': etag})
+        self.assertEqual((response.status, body), (200, b'<p>changed</p>'))
+        self.assertNotEqual(response.getheader('ETag'), etag)
+
+    def test_page_store(self):
+        self.server.page_store = store = PageStore()
+        store.update({'page.html': b'<p>stored</p>', 'dir/other/index.html': b'<p>other</p>'}, {}, ['page.html', 'dir/other/index.html'])
+        response, body = self.get('/page.html')
+        self.assertEqual((response.status, body), (200, b'<p>stored</p>'))
+        self.assertEqual(response.getheader('ETag'), store.get('page.html').etag)
+        response, body = self.get('/page.html', {'If-None-Match': response.getheader('ETag')})
+        self.assertEqual(response.status, 304)
+        response, body = self.get('/dir/other')
+        self.assertEqual((response.status, response.getheader('Location')), (301, '/dir/other/'))
+        response, body = self.get('/dir/other/')
+        self.assertEqual(body, b'<p>other</p>')
+        # not in the store
+        response, body = self.get('/dir/')
+        self.assertEqual(body, b'<p>index</p>')
+
+    def test_precompressed(self):
+        path = os.path.join(self.out_path, 'page.html')
+        compress_file(path, ['gzip'])
+        response, body = self.get('/page.html', {'Accept-Encoding': 'br, gzip'})
+        self.assertEqual(response.getheader('Content-Encoding'), 'gzip')
+        self.assertEqual(response.getheader('Vary'), 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(body), b'<p>page</p>')
+        response, body = self.get('/page.html', {'If-None-Match': response.getheader('ETag'), 'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status, 304)
+        response, body = self.get('/page.html', {'Accept-Encoding': 'gzip;q=0'})
+        self.assertEqual((response.getheader('Content-Encoding'), body), (None, b'<p>page</p>'))
+        with open(path, 'w') as f:
+            f.write('<p>changed</p>') # the sibling is out of date
+        response, body = self.get('/page.html', {'Accept-Encoding': 'gzip'})
+        self.assertEqual((response.getheader('Content-Encoding'), body), (None, b'<p>changed</p>'))
+
+    def test_live_reload(self):
+        self.server.reload_notifier = notifier = ReloadNotifier()
+        response, body = self.get('/page.html')
+        self.assertEqual(body, b'<p>page</p>' + RELOAD_SCRIPT)
+        self.assertEqual(int(response.getheader('Content-Length')), len(body))
+        response, body = self.get('/page.html', {'If-None-Match': response.getheader('ETag')})
+        self.assertEqual(response.status, 304)
+
+        events = http.client.HTTPConnection('localhost', self.server.server_address[1])
+        events.request('GET', RELOAD_EVENTS_PATH)
+        response = events.getresponse()
+        self.assertEqual(response.getheader('Content-Type'), 'text/event-stream')
+        self.assertEqual([response.fp.readline(), response.fp.readline()], [b'retry: 1000\n', b'\n'])
+        notifier.notify(['page.html', 'dir/index.html'])
+        self.assertEqual(response.fp.readline(), b'data: ["page.html", "dir/index.html"]\n')
+        notifier.close()
+        self.assertEqual(response.read(), b'\n')
+        events.close()
+
 if __name__ == '__main__':
     unittest.main()
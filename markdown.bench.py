@@ -0,0 +1,215 @@
+#!/usr/bin/python
+
+"""benchmarks markdown.Markdown.convert over a generated corpus, stage by stage.
+
+each document of the corpus stresses one part of the engine. for each, the time spent in the preprocessors, the BlockParser,
+the treeprocessors, the serializer and the postprocessors is reported, with the throughput of the whole conversion.
+each run appends one json line to the results file, so that runs can be compared across commits. e.g.:
+
+    python markdown.bench.py --scale 4 --verbose
+"""
+
+import argparse
+import collections
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import markdown
+
+EXTENSIONS = ['fenced_code', 'tables', 'def_list']
+STAGES = ['preprocessors', 'blockparser', 'treeprocessors', 'serializer', 'postprocessors']
+WORDS = '''lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore magna
+aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo consequat'''.split()
+
+def words(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+def emphasis(rng, scale):
+    """long paragraphs full of inline markup"""
+    spans = ['*%s*', '**%s**', '_%s_', '__%s__', '`%s`', '[%s](http://example.com/)', '<span>%s</span>', '%s &amp; co', '%s  \n']
+    paragraphs = []
+    for _ in range(40 * scale):
+        parts = []
+        for _ in range(60):
+            text = words(rng, rng.randint(1, 4))
+            parts.append(rng.choice(spans) % text if rng.random() < 0.4 else text)
+        paragraphs.append(' '.join(parts))
+    return '\n\n'.join(paragraphs)
+
+def nested_lists(rng, scale):
+    """lists nested up to six deep, mixing ordered and unordered items and paragraphs"""
+    lines = []
+    def items(depth):
+        for i in range(rng.randint(2, 4)):
+            marker = '%d.' % (i + 1) if depth % 2 else rng.choice('*+-')
+            lines.append('    ' * depth + '%s %s' % (marker, words(rng, 8)))
+            if rng.random() < 0.2:
+                lines.append('')
+                lines.append('    ' * (depth + 1) + words(rng, 12))
+                lines.append('')
+            if depth < 5 and rng.random() < 0.5:
+                items(depth + 1)
+    for _ in range(30 * scale):
+        items(0)
+        lines.append('')
+        lines.append(words(rng, 20))
+        lines.append('')
+    return '\n'.join(lines)
+
+def html_blocks(rng, scale):
+    """big raw html blocks between paragraphs"""
+    blocks = []
+    for _ in range(20 * scale):
+        rows = ''.join('<tr><td>%s</td><td>%s</td></tr>\n' % (words(rng, 3), words(rng, 5)) for _ in range(30))
+        blocks.append('<div class="block">\n<table>\n%s</table>\n<p>%s</p>\n</div>' % (rows, words(rng, 30)))
+        blocks.append(words(rng, 40))
+    return '\n\n'.join(blocks)
+
+def reference_links(rng, scale):
+    """many reference-style links, and their definitions"""
+    refs = 200 * scale
+    paragraphs = []
+    for _ in range(40 * scale):
+        parts = []
+        for _ in range(20):
+            parts.append('[%s][ref%d]' % (words(rng, 2), rng.randrange(refs)) if rng.random() < 0.3 else words(rng, 3))
+        paragraphs.append(' '.join(parts))
+    paragraphs.append('\n'.join('[ref%d]: http://example.com/%d "title %d"' % (i, i, i) for i in range(refs)))
+    return '\n\n'.join(paragraphs)
+
+def fenced_code(rng, scale):
+    """fenced and indented code blocks"""
+    blocks = []
+    for i in range(30 * scale):
+        code = '\n'.join('def f%d(x): return x * %d  # <%s> & more' % (j, j, words(rng, 2)) for j in range(20))
+        if i % 2:
+            blocks.append('~~~~\n%s\n~~~~' % code)
+        else:
+            blocks.append('\n'.join('    ' + line for line in code.splitlines()))
+        blocks.append(words(rng, 30))
+    return '\n\n'.join(blocks)
+
+def tables(rng, scale):
+    """pipe tables"""
+    blocks = []
+    for _ in range(20 * scale):
+        rows = ['Name | Value | Notes', '---- | ----- | -----']
+        rows.extend('%s | %d | *%s*' % (words(rng, 2), rng.randrange(1000), words(rng, 4)) for _ in range(25))
+        blocks.append('\n'.join(rows))
+        blocks.append(words(rng, 30))
+    return '\n\n'.join(blocks)
+
+def mixed(rng, scale):
+    """a bit of everything, like a real page"""
+    parts = []
+    for i in range(10 * scale):
+        parts.append('%s %s' % ('#' * (i % 3 + 1), words(rng, 4)))
+        parts.append('> ' + words(rng, 30) + '\n> *' + words(rng, 5) + '*')
+        parts.append(emphasis(rng, 1).split('\n\n')[0])
+        parts.append('* ' + words(rng, 5) + '\n* ' + words(rng, 5) + '\n    1. ' + words(rng, 5))
+        parts.append('%s\n:   %s' % (words(rng, 2), words(rng, 12)))
+        parts.append('- - -')
+    return '\n\n'.join(parts)
+
+CORPUS = [emphasis, nested_lists, html_blocks, reference_links, fenced_code, tables, mixed]
+
+def corpus(scale, seed=0):
+    """returns an ordered dict of the documents of the corpus, by name"""
+    return collections.OrderedDict((fn.__name__, fn(random.Random(seed), scale)) for fn in CORPUS)
+
+def instrument(md, timings):
+    """makes md add the seconds spent in each stage of convert, and in each processor, to the dict timings"""
+    def timed(names, fn):
+        def run(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                for name in names:
+                    timings[name] += elapsed
+        return run
+    for stage, processors in [('preprocessors', md.preprocessors), ('treeprocessors', md.treeprocessors), ('postprocessors', md.postprocessors)]:
+        for name, processor in processors.items():
+            processor.run = timed([stage, '%s.%s' % (stage, name)], processor.run)
+    md.parser.parseDocument = timed(['blockparser'], md.parser.parseDocument)
+    md.serializer = timed(['serializer'], md.serializer)
+
+def bench(text, repeat):
+    """converts text repeat times, returning its best total time, mean stage timings and throughput"""
+    timings = collections.defaultdict(float)
+    md = markdown.Markdown(extensions=EXTENSIONS)
+    instrument(md, timings)
+    times = []
+    for _ in range(repeat):
+        md.reset()
+        start = time.perf_counter()
+        md.convert(text)
+        times.append(time.perf_counter() - start)
+    size = len(text.encode('utf-8'))
+    stages = dict((stage, timings.pop(stage, 0.0) / repeat) for stage in STAGES)
+    return {
+        'bytes': size,
+        'best': min(times),
+        'mean': sum(times) / repeat,
+        'mb_per_s': size / min(times) / 1e6,
+        'stages': stages,
+        'processors': dict((name, t / repeat) for name, t in sorted(timings.items())),
+    }
+
+def git_commit():
+    """returns the current commit of the working tree, marked if it has uncommitted changes, or None"""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmarks markdown conversion stage by stage')
+    parser.add_argument('--scale', type=int, default=1, help='size multiplier for each document of the corpus (default: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the corpus (default: 0)')
+    parser.add_argument('--repeat', type=int, default=5, help='conversions of each document (default: 5)')
+    parser.add_argument('--only', action='append', choices=[fn.__name__ for fn in CORPUS], help='only run this document (may be repeated)')
+    parser.add_argument('--dump', metavar='DIR', help='write the corpus to DIR as .markdown files, for inspection')
+    parser.add_argument('--verbose', action='store_true', help='also report the time spent in each processor')
+    parser.add_argument('--results', default='markdown-bench-results.jsonl',
+                        help='file to append results to (default: markdown-bench-results.jsonl)')
+    args = parser.parse_args()
+
+    documents = corpus(args.scale, args.seed)
+    if args.dump:
+        if not os.access(args.dump, os.F_OK):
+            os.makedirs(args.dump)
+        for name, text in documents.items():
+            with open(os.path.join(args.dump, name + '.markdown'), 'w') as f:
+                f.write(text)
+
+    results = collections.OrderedDict()
+    print('%-16s %8s %9s %8s  %s' % ('document', 'KB', 'best', 'MB/s', '  '.join('%14s' % stage for stage in STAGES)))
+    for name, text in documents.items():
+        if args.only and name not in args.only:
+            continue
+        result = results[name] = bench(text, args.repeat)
+        print('%-16s %8.1f %8.4fs %8.3f  %s' % (name, result['bytes'] / 1e3, result['best'], result['mb_per_s'],
+                                                 '  '.join('%13.4fs' % result['stages'][stage] for stage in STAGES)))
+        if args.verbose:
+            for processor, t in result['processors'].items():
+                print('    %-40s %8.4fs' % (processor, t))
+    total_bytes = sum(result['bytes'] for result in results.values())
+    total_time = sum(result['best'] for result in results.values())
+    print('%-16s %8.1f %8.4fs %8.3f' % ('total', total_bytes / 1e3, total_time, total_bytes / total_time / 1e6))
+
+    record = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': git_commit(), 'python': sys.version.split()[0],
+              'params': {'scale': args.scale, 'seed': args.seed, 'repeat': args.repeat, 'extensions': EXTENSIONS},
+              'results': results, 'mb_per_s': total_bytes / total_time / 1e6}
+    with open(args.results, 'a') as f:
+        f.write(json.dumps(record, sort_keys=True) + '\n')
+    print('results appended to %s' % args.results)
+
+if __name__ == '__main__':
+    main()
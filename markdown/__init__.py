@@ -47,6 +47,7 @@ import codecs
 import sys
 import warnings
 import logging
+import threading
 from logging import DEBUG, INFO, WARN, ERROR, CRITICAL
 
 
@@ -344,6 +345,7 @@ class Markdown:
         """
         self.htmlStash.reset()
         self.references.clear()
+        del self.parser.state[:] # in case the last document raised mid-parse
 
         for extension in self.registeredExtensions:
             extension.reset()
@@ -537,9 +539,12 @@ def load_extension(ext_name, configs = []):
 
 
 def load_extensions(ext_names):
-    """Loads multiple extensions"""
+    """Loads multiple extensions, passing Extension instances through"""
     extensions = []
     for ext_name in ext_names:
+        if isinstance(ext_name, Extension):
+            extensions.append(ext_name)
+            continue
         extension = load_extension(ext_name)
         if extension:
             extensions.append(extension)
@@ -554,6 +559,44 @@ Those are the two functions we really mean to export: markdown() and
 markdownFromFile().
 """
 
+_converters = threading.local()
+
+def getMarkdown(extensions = [],
+                safe_mode = False,
+                output_format = DEFAULT_OUTPUT_FORMAT):
+    """Return a reset Markdown instance for the given settings.
+
+    Building a Markdown instance loads its extensions and compiles every
+    inline pattern, which can take longer than converting a short text.
+    So instances are built once per thread, keyed by the extension names,
+    safe_mode and output_format, and reset before being returned again.
+
+    Keyword arguments are as for markdown().  The instance is only good
+    until the next call with the same settings on the same thread.  If the
+    settings can't be used as a key (e.g. an extension is unhashable), a
+    new instance is built every time.
+
+    """
+    key = (tuple(extensions), safe_mode, output_format)
+    try:
+        instances = _converters.instances
+    except AttributeError:
+        instances = _converters.instances = {}
+    try:
+        md = instances.get(key)
+    except TypeError:
+        return Markdown(extensions=load_extensions(extensions),
+                        safe_mode=safe_mode,
+                        output_format=output_format)
+    if md is None:
+        md = instances[key] = Markdown(extensions=load_extensions(extensions),
+                                       safe_mode=safe_mode,
+                                       output_format=output_format)
+    else:
+        md.reset()
+    return md
+
+
 def markdown(text,
              extensions = [],
              safe_mode = False,
@@ -581,10 +624,7 @@ def markdown(text,
     Returns: An HTML document as a string.
 
     """
-    md = Markdown(extensions=load_extensions(extensions),
-                  safe_mode=safe_mode, 
-                  output_format=output_format)
-    return md.convert(text)
+    return getMarkdown(extensions, safe_mode, output_format).convert(text)
 
 
 def markdownFromFile(input = None,
@@ -1,5 +1,10 @@
 
 import markdown
+import collections
+import re
+
+# Matches the leading spaces of a block, and the character after them.
+LEADING_RE = re.compile(r'[ ]*(.?)', re.DOTALL)
 
 class State(list):
     """ Track the current and nested state of the parser. 
@@ -34,6 +39,47 @@ class State(list):
         else:
             return False
 
+class BlockQueue(collections.deque):
+    """ The blocks of text left to parse, consumed from the front.
+
+    BlockProcessors take the next block with ``popleft()`` and put back what
+    they did not use with ``appendleft()``, both in constant time. For 
+    processors written against a list of blocks, ``pop(0)``, ``insert(0, 
+    block)`` and slices work too.
+
+    """
+
+    def pop(self, index=-1):
+        """ Remove and return the block at ``index`` (the last by default). """
+        if index == 0:
+            return self.popleft()
+        if index == -1:
+            return collections.deque.pop(self)
+        block = self[index]
+        del self[index]
+        return block
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        return collections.deque.__getitem__(self, index)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            blocks = list(self)
+            blocks[index] = value
+            self.clear()
+            self.extend(blocks)
+        else:
+            collections.deque.__setitem__(self, index, value)
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            self[index] = []
+        else:
+            collections.deque.__delitem__(self, index)
+
+
 class BlockParser:
     """ Parse Markdown blocks into an ElementTree object. 
     
@@ -44,6 +90,9 @@ class BlockParser:
     def __init__(self):
         self.blockprocessors = markdown.odict.OrderedDict()
         self.state = State()
+        self.__processors = None
+        self.__version = None
+        self.__dispatch = {}
 
     def parseDocument(self, lines):
         """ Parse a markdown document into an ElementTree. 
@@ -81,15 +130,61 @@ class BlockParser:
         until there are no blocks left. While an extension could potentially
         call this method directly, it's generally expected to be used internally.
 
+        The blockprocessors are given the blocks as a ``BlockQueue``. A list
+        passed in is emptied once it has been parsed.
+
         This is a public method as an extension may need to add/alter additional
         BlockProcessors which call this method to recursively parse a nested
         block.
 
         """
-        while blocks:
-           for processor in list(self.blockprocessors.values()):
-               if processor.test(parent, blocks[0]):
-                   processor.run(parent, blocks)
+        queue = blocks
+        if not isinstance(queue, BlockQueue):
+            queue = BlockQueue(blocks)
+        while queue:
+           block = queue[0]
+           for processor in self.processorsFor(block):
+               if processor.test(parent, block):
+                   processor.run(parent, queue)
                    break
+        if isinstance(blocks, list):
+            del blocks[:]
+
+    def processorsFor(self, block):
+        """ Return the blockprocessors that may accept a block, in order. 
+
+        The processors are looked up in a table keyed on whether the block is
+        indented by a tab, and on the character after its leading spaces,
+        using the ``INDENT`` and ``FIRST`` hints of each processor. The table
+        is rebuilt whenever the blockprocessors change.
+
+        """
+        processors = self.blockprocessors
+        if processors is not self.__processors or \
+                processors.version != self.__version:
+            self.__processors = processors
+            self.__version = processors.version
+            self.__dispatch = {}
+        m = LEADING_RE.match(block)
+        key = (m.start(1) >= markdown.TAB_LENGTH, m.group(1))
+        try:
+            return self.__dispatch[key]
+        except KeyError:
+            indent, first = key
+            candidates = []
+            for processor in processors.values():
+                hint = getattr(processor, 'INDENT', None)
+                if hint is not None and hint != indent:
+                    continue
+                hint = getattr(processor, 'FIRST', None)
+                if hint is not None and not first:
+                    continue
+                if isinstance(hint, str) and first not in hint:
+                    continue
+                if hasattr(hint, 'match') and not hint.match(first):
+                    continue
+                candidates.append(processor)
+            self.__dispatch[key] = candidates
+            return candidates
 
 
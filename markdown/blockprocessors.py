@@ -24,8 +24,18 @@ class BlockProcessor:
     whether the current block should be processed by this processor. If the
     test passes, the parser will call the processors ``run`` method.
 
+    Subclasses may also describe the blocks that ``test`` can accept, so that
+    the parser does not try the processor on others. ``INDENT`` is True if 
+    the block must start with a tab's worth of spaces, and False if it must
+    not. ``FIRST`` is a string of the characters that may follow the leading
+    spaces of the block, or a compiled regular expression matching them. None
+    places no restriction.
+
     """
 
+    INDENT = None
+    FIRST = None
+
     def __init__(self, parser=None):
         self.parser = parser
 
@@ -91,13 +101,13 @@ class BlockProcessor:
         mechanism to return new/different objects to replace them.
 
         This means that this method should be adding SubElements or adding text
-        to the parent, and should remove (``pop``) or add (``insert``) items to
-        the list of blocks.
+        to the parent, and should remove (``popleft``) or add (``appendleft``)
+        items to the front of the queue of blocks.
 
         Keywords:
 
         * ``parent``: A etree element which is the parent of the current block.
-        * ``blocks``: A list of all remaining blocks of the document.
+        * ``blocks``: A ``BlockQueue`` of all remaining blocks of the document.
         """
         pass
 
@@ -115,6 +125,7 @@ class ListIndentProcessor(BlockProcessor):
 
     INDENT_RE = re.compile(r'^(([ ]{%s})+)'% markdown.TAB_LENGTH)
     ITEM_TYPES = ['li']
+    INDENT = True
     LIST_TYPES = ['ul', 'ol']
 
     def test(self, parent, block):
@@ -127,7 +138,7 @@ class ListIndentProcessor(BlockProcessor):
                 )
 
     def run(self, parent, blocks):
-        block = blocks.pop(0)
+        block = blocks.popleft()
         level, sibling = self.get_level(parent, block)
         block = self.looseDetab(block, level)
 
@@ -186,12 +197,14 @@ class ListIndentProcessor(BlockProcessor):
 class CodeBlockProcessor(BlockProcessor):
     """ Process code blocks. """
 
+    INDENT = True
+
     def test(self, parent, block):
         return block.startswith(' '*markdown.TAB_LENGTH)
     
     def run(self, parent, blocks):
         sibling = self.lastChild(parent)
-        block = blocks.pop(0)
+        block = blocks.popleft()
         theRest = ''
         if sibling and sibling.tag == "pre" and len(sibling) \
                     and sibling[0].tag == "code":
@@ -211,7 +224,7 @@ class CodeBlockProcessor(BlockProcessor):
             # This block contained unindented line(s) after the first indented 
             # line. Insert these lines as the first block of the master blocks
             # list for future processing.
-            blocks.insert(0, theRest)
+            blocks.appendleft(theRest)
 
 
 class BlockQuoteProcessor(BlockProcessor):
@@ -222,7 +235,7 @@ class BlockQuoteProcessor(BlockProcessor):
         return bool(self.RE.search(block))
 
     def run(self, parent, blocks):
-        block = blocks.pop(0)
+        block = blocks.popleft()
         m = self.RE.search(block)
         if m:
             before = block[:m.start()] # Lines before blockquote
@@ -261,13 +274,15 @@ class OListProcessor(BlockProcessor):
     CHILD_RE = re.compile(r'^[ ]{0,3}((\d+\.)|[*+-])[ ](.*)')
     # Detect indented (nested) items of either type
     INDENT_RE = re.compile(r'^[ ]{4,7}((\d+\.)|[*+-])[ ].*')
+    INDENT = False
+    FIRST = re.compile(r'\d')
 
     def test(self, parent, block):
         return bool(self.RE.match(block))
 
     def run(self, parent, blocks):
         # Check fr multiple items in one block.
-        items = self.get_items(blocks.pop(0))
+        items = self.get_items(blocks.popleft())
         sibling = self.lastChild(parent)
         if sibling and sibling.tag in ['ol', 'ul']:
             # Previous block was a list item, so set that as parent
@@ -325,6 +340,7 @@ class UListProcessor(OListProcessor):
 
     TAG = 'ul'
     RE = re.compile(r'^[ ]{0,3}[*+-][ ](.*)')
+    FIRST = '*+-'
 
 
 class HashHeaderProcessor(BlockProcessor):
@@ -337,7 +353,7 @@ class HashHeaderProcessor(BlockProcessor):
         return bool(self.RE.search(block))
 
     def run(self, parent, blocks):
-        block = blocks.pop(0)
+        block = blocks.popleft()
         m = self.RE.search(block)
         if m:
             before = block[:m.start()] # All lines before header
@@ -352,7 +368,7 @@ class HashHeaderProcessor(BlockProcessor):
             h.text = m.group('header').strip()
             if after:
                 # Insert remaining lines as first block for future parsing.
-                blocks.insert(0, after)
+                blocks.appendleft(after)
         else:
             # This should never happen, but just in case...
             message(CRITICAL, "We've got a problem header!")
@@ -368,7 +384,7 @@ class SetextHeaderProcessor(BlockProcessor):
         return bool(self.RE.match(block))
 
     def run(self, parent, blocks):
-        lines = blocks.pop(0).split('\n')
+        lines = blocks.popleft().split('\n')
         # Determine level. ``=`` is 1 and ``-`` is 2.
         if lines[1].startswith('='):
             level = 1
@@ -378,7 +394,7 @@ class SetextHeaderProcessor(BlockProcessor):
         h.text = lines[0].strip()
         if len(lines) > 2:
             # Block contains additional lines. Add to  master blocks for later.
-            blocks.insert(0, '\n'.join(lines[2:]))
+            blocks.appendleft('\n'.join(lines[2:]))
 
 
 class HRProcessor(BlockProcessor):
@@ -394,7 +410,7 @@ class HRProcessor(BlockProcessor):
         return bool(self.SEARCH_RE.search(block))
 
     def run(self, parent, blocks):
-        lines = blocks.pop(0).split('\n')
+        lines = blocks.popleft().split('\n')
         prelines = []
         # Check for lines in block before hr.
         for line in lines:
@@ -412,7 +428,7 @@ class HRProcessor(BlockProcessor):
         lines = lines[len(prelines)+1:]
         if len(lines):
             # Add lines after hr to master blocks for later parsing.
-            blocks.insert(0, '\n'.join(lines))
+            blocks.appendleft('\n'.join(lines))
 
 
 class EmptyBlockProcessor(BlockProcessor):
@@ -421,16 +437,17 @@ class EmptyBlockProcessor(BlockProcessor):
     # Detect a block that only contains whitespace 
     # or only whitespace on the first line.
     RE = re.compile(r'^\s*\n')
+    FIRST = re.compile(r'\s')
 
     def test(self, parent, block):
         return bool(self.RE.match(block))
 
     def run(self, parent, blocks):
-        block = blocks.pop(0)
+        block = blocks.popleft()
         m = self.RE.match(block)
         if m:
             # Add remaining line to master blocks for later.
-            blocks.insert(0, block[m.end():])
+            blocks.appendleft(block[m.end():])
             sibling = self.lastChild(parent)
             if sibling and sibling.tag == 'pre' and sibling[0] and \
                     sibling[0].tag == 'code':
@@ -445,7 +462,7 @@ class ParagraphProcessor(BlockProcessor):
         return True
 
     def run(self, parent, blocks):
-        block = blocks.pop(0)
+        block = blocks.popleft()
         if block.strip():
             # Not a blank block. Add to parent, otherwise throw it away.
             if self.parser.state.isstate('list'):
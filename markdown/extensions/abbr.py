@@ -34,7 +34,15 @@ class AbbrExtension(markdown.Extension):
 
     def extendMarkdown(self, md, md_globals):
         """ Insert AbbrPreprocessor before ReferencePreprocessor. """
+        self.md = md
+        md.registerExtension(self)
         md.preprocessors.add('abbr', AbbrPreprocessor(md), '<reference')
+
+    def reset(self):
+        """ Forget the abbreviations of the last document. """
+        for key in list(self.md.inlinePatterns.keys()):
+            if key.startswith('abbr-'):
+                del self.md.inlinePatterns[key]
         
            
 class AbbrPreprocessor(markdown.preprocessors.Preprocessor):
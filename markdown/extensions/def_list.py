@@ -32,7 +32,7 @@ class DefListProcessor(markdown.blockprocessors.BlockProcessor):
         return bool(self.RE.search(block))
 
     def run(self, parent, blocks):
-        block = blocks.pop(0)
+        block = blocks.popleft()
         m = self.RE.search(block)
         terms = [l.strip() for l in block[:m.start()].split('\n') if l.strip()]
         d, theRest = self.detab(block[m.end():])
@@ -71,7 +71,7 @@ class DefListProcessor(markdown.blockprocessors.BlockProcessor):
         self.parser.state.reset()
 
         if theRest:
-            blocks.insert(0, theRest)
+            blocks.appendleft(theRest)
 
 class DefListIndentProcessor(markdown.blockprocessors.ListIndentProcessor):
     """ Process indented children of definition list items. """
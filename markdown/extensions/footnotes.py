@@ -54,8 +54,9 @@ class FootnoteExtension(markdown.Extension):
                              "<reference")
         # Insert an inline pattern before ImageReferencePattern
         FOOTNOTE_RE = r'\[\^([^\]]*)\]' # blah blah [^1] blah
-        md.inlinePatterns.add("footnote", FootnotePattern(FOOTNOTE_RE, self),
-                              "<reference")
+        footnotePattern = FootnotePattern(FOOTNOTE_RE, self)
+        footnotePattern.triggers = '['
+        md.inlinePatterns.add("footnote", footnotePattern, "<reference")
         # Insert a tree-processor that would actually add the footnote div
         # This must be before the inline treeprocessor so inline patterns
         # run on the contents of the div.
@@ -93,7 +93,7 @@ class HeaderIdProcessor(markdown.blockprocessors.BlockProcessor):
         return bool(self.RE.search(block))
 
     def run(self, parent, blocks):
-        block = blocks.pop(0)
+        block = blocks.popleft()
         m = self.RE.search(block)
         if m:
             before = block[:m.start()] # All lines before header
@@ -116,7 +116,7 @@ class HeaderIdProcessor(markdown.blockprocessors.BlockProcessor):
                 h.set('id', self._create_id(m.group('header').strip()))
             if after:
                 # Insert remaining lines as first block for future parsing.
-                blocks.insert(0, after)
+                blocks.appendleft(after)
         else:
             # This should never happen, but just in case...
             message(CRITICAL, "We've got a problem header!")
@@ -29,7 +29,7 @@ class TableProcessor(markdown.blockprocessors.BlockProcessor):
 
     def run(self, parent, blocks):
         """ Parse a table block and build table. """
-        block = blocks.pop(0).split('\n')
+        block = blocks.popleft().split('\n')
         header = block[:2]
         rows = block[2:]
         # Get format type (bordered by pipes or not)
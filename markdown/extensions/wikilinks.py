@@ -108,6 +108,7 @@ class WikiLinkExtension(markdown.Extension):
         WIKILINK_RE = r'\[\[([A-Za-z0-9_ -]+)\]\]'
         wikilinkPattern = WikiLinks(WIKILINK_RE, self.config)
         wikilinkPattern.md = md
+        wikilinkPattern.triggers = '['
         md.inlinePatterns.add('wikilink', wikilinkPattern, "<not_strong")
 
 
@@ -20,6 +20,9 @@ capture the whole block.  For this reason, they all start with
 '^(.*)' and end with '(.*)!'.  In case with built-in expression
 Pattern takes care of adding the "^(.*)" and "(.*)!".
 
+Patterns that have a `positional_re` are instead matched at offsets of
+the block, with empty first and last groups.
+
 Finally, the order in which regular expressions are applied is very
 important - e.g. if we first replace http://.../ links with <a> tags
 and _then_ try to replace inline html, we would end up with a mess.
@@ -90,6 +93,28 @@ ENTITY_RE = r'(&[\#a-zA-Z0-9]*;)'               # &amp;
 LINE_BREAK_RE = r'  \n'                     # two spaces at end of line
 LINE_BREAK_2_RE = r'  $'                    # two spaces at end of text
 
+# The characters that every match of each pattern starts with.  A pattern
+# whose characters do not appear in a string cannot match it, and is skipped.
+TRIGGERS = {
+    BACKTICK_RE: '`',
+    ESCAPE_RE: '\\',
+    EMPHASIS_RE: '*',
+    STRONG_RE: '*_',
+    STRONG_EM_RE: '*_',
+    EMPHASIS_2_RE: '_',
+    LINK_RE: '[',
+    IMAGE_LINK_RE: '!',
+    REFERENCE_RE: '[',
+    IMAGE_REFERENCE_RE: '!',
+    NOT_STRONG_RE: ' ',
+    AUTOLINK_RE: '<',
+    AUTOMAIL_RE: '<',
+    HTML_RE: '<',
+    ENTITY_RE: '&',
+    LINE_BREAK_RE: ' ',
+    LINE_BREAK_2_RE: ' ',
+}
+
 
 def dequote(string):
     """Remove quotes from around a string."""
@@ -124,9 +149,21 @@ class Pattern:
 
         * pattern: A regular expression that matches a pattern
 
+        The `triggers` attribute holds the characters that every match of
+        the pattern starts with, or None if they are not known.  Subclasses
+        with their own regular expressions may set it.
+
+        The `positional_re` attribute is used to match the pattern at an
+        offset of a string.  Its first and last groups are empty, in place
+        of the text before and after the match.  Subclasses that replace
+        `compiled_re` should replace it too, or set it to None to be matched
+        with `compiled_re`.
+
         """
         self.pattern = pattern
         self.compiled_re = re.compile("^(.*?)%s(.*?)$" % pattern, re.DOTALL)
+        self.positional_re = re.compile("()%s()" % pattern, re.DOTALL)
+        self.triggers = TRIGGERS.get(pattern)
 
         # Api for Markdown to pass safe_mode into instance
         self.safe_mode = False
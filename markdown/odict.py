@@ -4,10 +4,14 @@ class OrderedDict(dict):
     
     Copied from Django's SortedDict with some modifications.
 
+    ``version`` is incremented each time an item is set, removed or moved, so
+    that users can cache what they derive from the dictionary.
+
     """
     def __new__(cls, *args, **kwargs):
         instance = super(OrderedDict, cls).__new__(cls, *args, **kwargs)
         instance.keyOrder = []
+        instance.version = 0
         return instance
 
     def __init__(self, data=None):
@@ -29,12 +33,14 @@ class OrderedDict(dict):
 
     def __setitem__(self, key, value):
         super(OrderedDict, self).__setitem__(key, value)
+        self.version += 1
         if key not in self.keyOrder:
             self.keyOrder.append(key)
 
     def __delitem__(self, key):
         super(OrderedDict, self).__delitem__(key)
         self.keyOrder.remove(key)
+        self.version += 1
 
     def __iter__(self):
         for k in self.keyOrder:
@@ -42,6 +48,7 @@ class OrderedDict(dict):
 
     def pop(self, k, *args):
         result = super(OrderedDict, self).pop(k, *args)
+        self.version += 1
         try:
             self.keyOrder.remove(k)
         except ValueError:
@@ -52,6 +59,7 @@ class OrderedDict(dict):
     def popitem(self):
         result = super(OrderedDict, self).popitem()
         self.keyOrder.remove(result[0])
+        self.version += 1
         return result
 
     def items(self):
@@ -81,6 +89,7 @@ class OrderedDict(dict):
     def setdefault(self, key, default):
         if key not in self.keyOrder:
             self.keyOrder.append(key)
+            self.version += 1
         return super(OrderedDict, self).setdefault(key, default)
 
     def value_for_index(self, index):
@@ -96,6 +105,7 @@ class OrderedDict(dict):
                 index -= 1
         self.keyOrder.insert(index, key)
         super(OrderedDict, self).__setitem__(key, value)
+        self.version += 1
 
     def copy(self):
         """Return a copy of this object."""
@@ -114,6 +124,7 @@ class OrderedDict(dict):
     def clear(self):
         super(OrderedDict, self).clear()
         self.keyOrder = []
+        self.version += 1
 
     def index(self, key):
         """ Return the index of a given key. """
@@ -150,6 +161,7 @@ class OrderedDict(dict):
         """ Change location of an existing item. """
         n = self.keyOrder.index(key)
         del self.keyOrder[n]
+        self.version += 1
         i = self.index_for_location(location)
         try:
             if i is not None:
@@ -108,17 +108,16 @@ class HtmlBlockPreprocessor(Preprocessor):
     def run(self, lines):
         text = "\n".join(lines)
         new_blocks = []
-        text = text.split("\n\n")
+        text = markdown.blockparser.BlockQueue(text.split("\n\n"))
         items = []
         left_tag = ''
         right_tag = ''
         in_tag = False # flag
 
         while text:
-            block = text[0]
+            block = text.popleft()
             if block.startswith("\n"):
                 block = block[1:]
-            text = text[1:]
 
             if block.startswith("\n"):
                 block = block[1:]
@@ -129,7 +128,7 @@ class HtmlBlockPreprocessor(Preprocessor):
                     right_tag, data_index = self._get_right_tag(left_tag, block)
 
                     if data_index < len(block):
-                        text.insert(0, block[data_index:])
+                        text.appendleft(block[data_index:])
                         block = block[:data_index]
 
                     if not (markdown.isBlockLevel(left_tag) \
@@ -42,6 +42,7 @@ class InlineProcessor(Treeprocessor):
         self.__placeholder_length = 4 + len(self.__placeholder_prefix) \
                                       + len(self.__placeholder_suffix)
         self.__placeholder_re = re.compile(markdown.INLINE_PLACEHOLDER % r'([0-9]{4})')
+        self.__placeholder_chars = set(markdown.INLINE_PLACEHOLDER % '0123456789')
         self.markdown = md
 
     def __makePlaceholder(self, type):
@@ -88,13 +89,19 @@ class InlineProcessor(Treeprocessor):
 
         """
         if not isinstance(data, markdown.AtomicString):
-            startIndex = 0
+            # one pass over the string finds the characters that matches can
+            # start with; patterns that cannot match are skipped, in order
+            present = set(data)
             while patternIndex < len(self.markdown.inlinePatterns):
-                data, matched, startIndex = self.__applyPattern(
-                    self.markdown.inlinePatterns.value_for_index(patternIndex),
-                    data, patternIndex, startIndex)
-                if not matched:
-                    patternIndex += 1
+                pattern = self.markdown.inlinePatterns.value_for_index(patternIndex)
+                triggers = getattr(pattern, 'triggers', None)
+                if triggers is None or not present.isdisjoint(triggers):
+                    data, matched = self.__applyPattern(pattern, data,
+                                                        patternIndex)
+                    if matched:
+                        # matches were replaced with placeholders
+                        present.update(self.__placeholder_chars)
+                patternIndex += 1
         return data
 
     def __processElementText(self, node, subnode, isText=True):
@@ -121,7 +128,7 @@ class InlineProcessor(Treeprocessor):
         childResult = self.__processPlaceholders(text, subnode)
 
         if not isText and node is not subnode:
-            pos = node.getchildren().index(subnode)
+            pos = list(node).index(subnode)
             node.remove(subnode)
         else:
             pos = 0
@@ -169,7 +176,7 @@ class InlineProcessor(Treeprocessor):
                         linkText(text)
 
                     if not isString(node): # it's Element
-                        for child in [node] + node.getchildren():
+                        for child in [node] + list(node):
                             if child.tail:
                                 if child.tail.strip():
                                     self.__processElementText(node, child, False)
@@ -195,36 +202,24 @@ class InlineProcessor(Treeprocessor):
 
         return result
 
-    def __applyPattern(self, pattern, data, patternIndex, startIndex=0):
+    def __handleMatch(self, pattern, match, patternIndex):
         """
-        Check if the line fits the pattern, create the necessary
-        elements, add it to stashed_nodes.
-
-        Keyword arguments:
-
-        * data: the text to be processed
-        * pattern: the pattern to be checked
-        * patternIndex: index of current pattern
-        * startIndex: string index, from which we starting search
+        Create the element for a match of the pattern, and add it to
+        stashed_nodes.
 
-        Returns: String with placeholders instead of ElementTree elements.
+        Returns: placeholder for the element, or None if the pattern
+        declined the match.
 
         """
-        match = pattern.getCompiledRegExp().match(data[startIndex:])
-        leftData = data[:startIndex]
-
-        if not match:
-            return data, False, 0
-
         node = pattern.handleMatch(match)
 
         if node is None:
-            return data, True, len(leftData) + match.span(len(match.groups()))[0]
+            return None
 
         if not isString(node):
             if not isinstance(node.text, markdown.AtomicString):
                 # We need to process current node too
-                for child in [node] + node.getchildren():
+                for child in [node] + list(node):
                     if not isString(node):
                         if child.text:
                             child.text = self.__handleInline(child.text,
@@ -233,11 +228,112 @@ class InlineProcessor(Treeprocessor):
                             child.tail = self.__handleInline(child.tail,
                                                             patternIndex)
 
-        placeholder = self.__stashNode(node, pattern.type())
+        return self.__stashNode(node, pattern.type())
+
+    def __applyPattern(self, pattern, data, patternIndex):
+        """
+        Replace every match of the pattern in the line with a placeholder,
+        and add the created elements to stashed_nodes.
+
+        Matches are found left to right with `pattern.positional_re`, and
+        the result is assembled from the spans between them.  Replacing a
+        match can let the pattern match earlier in the line, so the line is
+        only rebuilt and searched again from there when text before the
+        match could start a match, or when the next match follows a
+        placeholder.  As with `compiled_re`, whose last group stops before a
+        final newline, each replaced match that ends before the end of the
+        line drops one trailing newline.
+
+        Keyword arguments:
 
-        return "%s%s%s%s" % (leftData,
-                             match.group(1),
-                             placeholder, match.groups()[-1]), True, 0
+        * pattern: the pattern to be checked
+        * data: the text to be processed
+        * patternIndex: index of current pattern
+
+        Returns: String with placeholders instead of ElementTree elements,
+        and whether any match was replaced.
+
+        """
+        regexp = getattr(pattern, 'positional_re', None)
+        if regexp is None:
+            return self.__applyCompiledPattern(pattern, data, patternIndex)
+        triggers = getattr(pattern, 'triggers', None)
+        if triggers is not None and \
+                not self.__placeholder_chars.isdisjoint(triggers):
+            triggers = None
+
+        matched = False
+        spans = []
+        length = 0    # of the spans
+        copied = 0    # end of the text copied to the spans
+        pos = 0
+        end = len(data)
+        rescan = None # where to search the rebuilt line from
+        while True:
+            match = regexp.search(data, pos, end)
+            if not match:
+                break
+            if spans and match.start() == copied:
+                rescan = length
+            else:
+                pos = match.end()
+                placeholder = self.__handleMatch(pattern, match, patternIndex)
+                if placeholder is None:
+                    continue
+                matched = True
+                if triggers is None:
+                    rescan = 0
+                elif rescan is None:
+                    for trigger in triggers:
+                        index = data.find(trigger, copied, match.start())
+                        if index != -1 and (rescan is None or
+                                            length + index - copied < rescan):
+                            rescan = length + index - copied
+                spans.append(data[copied:match.start()])
+                spans.append(placeholder)
+                length += match.start() - copied + len(placeholder)
+                copied = pos
+                if pos < end and data[end - 1] == '\n':
+                    end -= 1
+            if rescan is not None:
+                spans.append(data[copied:end])
+                data = ''.join(spans)
+                spans = []
+                length = copied = 0
+                pos = rescan
+                end = len(data)
+                rescan = None
+
+        if spans:
+            spans.append(data[copied:end])
+            data = ''.join(spans)
+        return data, matched
+
+    def __applyCompiledPattern(self, pattern, data, patternIndex):
+        """
+        Replace every match of a pattern without `positional_re`, using
+        `compiled_re` on the remainder of the line after each match.
+
+        Returns: String with placeholders instead of ElementTree elements,
+        and whether any match was replaced.
+
+        """
+        matched = False
+        startIndex = 0
+        while True:
+            match = pattern.getCompiledRegExp().match(data[startIndex:])
+            if not match:
+                return data, matched
+            leftData = data[:startIndex]
+            placeholder = self.__handleMatch(pattern, match, patternIndex)
+            if placeholder is None:
+                startIndex = len(leftData) + \
+                             match.span(len(match.groups()))[0]
+                continue
+            data = "%s%s%s%s" % (leftData, match.group(1),
+                                 placeholder, match.groups()[-1])
+            matched = True
+            startIndex = 0
 
     def run(self, tree):
         """Apply inline patterns to a parsed Markdown tree.
@@ -263,7 +359,7 @@ class InlineProcessor(Treeprocessor):
         while stack:
             currElement = stack.pop()
             insertQueue = []
-            for child in currElement.getchildren():
+            for child in currElement:
                 if child.text and not isinstance(child.text, markdown.AtomicString):
                     text = child.text
                     child.text = None
@@ -272,7 +368,7 @@ class InlineProcessor(Treeprocessor):
                     stack += lst
                     insertQueue.append((child, lst))
 
-                if child.getchildren():
+                if len(child):
                     stack.append(child)
 
             for element, lst in insertQueue:
@@ -321,7 +417,7 @@ class PrettifyTreeprocessor(Treeprocessor):
         self._prettifyETree(root)
         # Do <br />'s seperately as they are often in the middle of
         # inline content and missed by _prettifyETree.
-        brs = root.getiterator('br')
+        brs = root.iter('br')
         for br in brs:
             if not br.tail or not br.tail.strip():
                 br.tail = '\n'